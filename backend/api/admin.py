@@ -0,0 +1,16 @@
+from django.contrib import admin
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'run_at', 'duration',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'error')
+    readonly_fields = (
+        'name', 'args', 'attempts', 'started_at', 'finished_at',
+        'duration', 'error',
+    )
@@ -0,0 +1,94 @@
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_KEY = 'auth:token:{}'
+
+stats = Counter()
+
+
+class LRUCache:
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+local_cache = LRUCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_LOCAL_CACHE_TIMEOUT
+)
+
+
+def get_shared_cache():
+    if not settings.TOKEN_CACHE_ALIAS:
+        return None
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def invalidate_tokens(keys):
+    keys = list(keys)
+    for key in keys:
+        local_cache.delete(key)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete_many([CACHE_KEY.format(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            return self.shared_credentials(shared_cache, key)
+        credentials = local_cache.get(key)
+        if credentials is not None:
+            stats['local_hits'] += 1
+            return tuple(copy.copy(item) for item in credentials)
+        stats['misses'] += 1
+        credentials = super().authenticate_credentials(key)
+        local_cache.set(key, credentials)
+        return credentials
+
+    def shared_credentials(self, shared_cache, key):
+        cache_key = CACHE_KEY.format(key)
+        credentials = shared_cache.get(cache_key)
+        if credentials is not None:
+            stats['shared_hits'] += 1
+            return credentials
+        stats['misses'] += 1
+        credentials = super().authenticate_credentials(key)
+        shared_cache.set(cache_key, credentials, settings.TOKEN_CACHE_TIMEOUT)
+        return credentials
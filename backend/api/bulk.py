@@ -0,0 +1,168 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import CustomUser
+
+from api.images import schedule_thumbnails
+from api.pantry import schedule_pantry_update
+from api.recipe_search import schedule_search_update
+from api.serializers import RecipeImportSerializer
+
+RELATIONS = ('ingredients', 'tags')
+
+
+def batches(items, size):
+    items = iter(items)
+    batch = list(islice(items, size))
+    while batch:
+        yield batch
+        batch = list(islice(items, size))
+
+
+def collect_ids(records, field, get_id):
+    ids = set()
+    for record in records:
+        if not isinstance(record, dict) or not isinstance(
+            record.get(field), list
+        ):
+            continue
+        for item in record[field]:
+            try:
+                ids.add(int(get_id(item)))
+            except (TypeError, ValueError):
+                continue
+    return ids
+
+
+def prefetch_batch(records):
+    ingredient_ids = collect_ids(
+        records,
+        'ingredients',
+        lambda item: item.get('id') if isinstance(item, dict) else None
+    )
+    tag_ids = collect_ids(records, 'tags', lambda item: item)
+    return {
+        Ingredient: Ingredient.objects.in_bulk(ingredient_ids),
+        Tag: Tag.objects.in_bulk(tag_ids),
+    }
+
+
+def save_batch(items, author):
+    recipes = [
+        Recipe(
+            author=author,
+            ingredients_count=len(data['ingredients']),
+            **{
+                field: value for field, value in data.items()
+                if field not in RELATIONS
+            }
+        )
+        for _, data in items
+    ]
+    with transaction.atomic():
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            CustomUser.objects.filter(pk=author.pk).update(
+                recipes_count=F('recipes_count') + len(recipes)
+            )
+        else:
+            for recipe in recipes:
+                recipe.save()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for recipe, (_, data) in zip(recipes, items)
+            for tag in data['tags']
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for recipe, (_, data) in zip(recipes, items)
+            for ingredient in data['ingredients']
+        ])
+        for recipe in recipes:
+            schedule_pantry_update(recipe.pk)
+        schedule_search_update([recipe.pk for recipe in recipes])
+    for recipe in recipes:
+        schedule_thumbnails(recipe)
+    return recipes
+
+
+def import_recipes(records, author, batch_size=None):
+    batch_size = batch_size or settings.RECIPE_BULK_BATCH_SIZE
+    index = 0
+    for batch in batches(records, batch_size):
+        context = {'prefetched': prefetch_batch(batch)}
+        valid = []
+        for record in batch:
+            serializer = RecipeImportSerializer(data=record, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                yield {'index': index, 'errors': serializer.errors}
+            index += 1
+        if not valid:
+            continue
+        try:
+            recipes = save_batch(valid, author)
+        except DatabaseError as error:
+            for item_index, _ in valid:
+                yield {'index': item_index, 'errors': [str(error)]}
+            continue
+        for (item_index, _), recipe in zip(valid, recipes):
+            yield {'index': item_index, 'id': recipe.pk}
+
+
+def read_records(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if line.strip():
+            yield json.loads(line)
+
+
+def export_record(recipe, request=None):
+    image = recipe.image.url if recipe.image else None
+    if image and request is not None:
+        image = request.build_absolute_uri(image)
+    return {
+        'id': recipe.pk,
+        'author': recipe.author_id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image_url': image,
+        'tags': [tag.pk for tag in recipe.tags.all()],
+        'ingredients': [
+            {'id': item.ingredient_id, 'amount': item.amount}
+            for item in recipe.recipeingredient_set.all()
+        ],
+    }
+
+
+def export_recipes(request=None, chunk_size=None):
+    chunk_size = chunk_size or settings.RECIPE_EXPORT_CHUNK_SIZE
+    last_pk = 0
+    while True:
+        chunk = list(
+            Recipe.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').prefetch_related(
+                'tags', 'recipeingredient_set'
+            )[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield ''.join(
+            json.dumps(export_record(recipe, request), ensure_ascii=False)
+            + '\n'
+            for recipe in chunk
+        )
+        last_pk = chunk[-1].pk
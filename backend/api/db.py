@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'db:pin:{}'
+PIN_COOKIE = 'db_pin'
+PRIMARY_APPS = {'api', 'authtoken', 'sessions'}
+
+_state = threading.local()
+_unavailable = {}
+
+
+def check_connections():
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+def get_replicas():
+    return [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+
+
+def mark_unavailable(alias):
+    _unavailable[alias] = time.monotonic() + settings.REPLICA_RETRY_TIMEOUT
+
+
+def choose_replica():
+    now = time.monotonic()
+    replicas = [
+        alias for alias in get_replicas()
+        if _unavailable.get(alias, 0) <= now
+    ]
+    random.shuffle(replicas)
+    for alias in replicas:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна.', alias, exc_info=True)
+            mark_unavailable(alias)
+            continue
+        return alias
+    return None
+
+
+def get_client_key(request):
+    credentials = request.META.get(
+        'HTTP_AUTHORIZATION'
+    ) or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return hashlib.sha1(credentials.encode()).hexdigest()
+
+
+def is_pinned(request):
+    if request.get_signed_cookie(
+        PIN_COOKIE,
+        default=None,
+        salt=PIN_COOKIE,
+        max_age=settings.REPLICA_PIN_TIMEOUT
+    ) is not None:
+        return True
+    key = get_client_key(request)
+    return key is not None and cache.get(PIN_KEY.format(key)) is not None
+
+
+def pin(request, response):
+    response.set_signed_cookie(
+        PIN_COOKIE,
+        '1',
+        salt=PIN_COOKIE,
+        max_age=settings.REPLICA_PIN_TIMEOUT,
+        httponly=True,
+        samesite='Lax'
+    )
+    key = get_client_key(request)
+    if key is not None:
+        cache.set(PIN_KEY.format(key), True, settings.REPLICA_PIN_TIMEOUT)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return getattr(_state, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        _state.alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            request.method in SAFE_METHODS
+            and get_replicas()
+            and not is_pinned(request)
+        ):
+            _state.alias = choose_replica()
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.alias = None
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and get_replicas()
+        ):
+            pin(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        alias = getattr(_state, 'alias', None)
+        if alias is None or not isinstance(exception, DatabaseError):
+            return None
+        logger.warning(
+            'Ошибка реплики %s, запрос повторяется на основной базе.', alias,
+            exc_info=True
+        )
+        mark_unavailable(alias)
+        connections[alias].close()
+        _state.alias = None
+        match = request.resolver_match
+        return match.func(request, *match.args, **match.kwargs)
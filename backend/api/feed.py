@@ -0,0 +1,126 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    Subscription,
+    Tag
+)
+
+from api.cache import get_version
+from api.metrics import timer
+from api.serializers import RecipeListSerializer
+
+FRAGMENT_KEY = 'feed:recipe:{}:{}'
+OVERLAY_KEY = 'feed:overlay:{}'
+
+stats = Counter()
+
+
+def fragment_version():
+    return f'{get_version(Tag)}.{get_version(Ingredient)}'
+
+
+def get_fragments(recipe_ids, request, counters):
+    version = fragment_version()
+    keys = {
+        recipe_id: FRAGMENT_KEY.format(version, recipe_id)
+        for recipe_id in recipe_ids
+    }
+    cached = cache.get_many(keys.values())
+    fragments = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items()
+        if key in cached
+    }
+    missing = [
+        recipe_id for recipe_id in recipe_ids if recipe_id not in fragments
+    ]
+    if missing:
+        recipes = Recipe.objects.filter(
+            pk__in=missing
+        ).for_user(AnonymousUser())
+        serializer = RecipeListSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        with timer('serializer'):
+            created = {
+                fragment['id']: fragment for fragment in serializer.data
+            }
+        cache.set_many(
+            {keys[recipe_id]: data for recipe_id, data in created.items()},
+            settings.FEED_CACHE_TIMEOUT
+        )
+        fragments.update(created)
+    counters['fragment_hits'] += len(recipe_ids) - len(missing)
+    counters['fragment_misses'] += len(missing)
+    return fragments
+
+
+def get_overlay(user, counters):
+    key = OVERLAY_KEY.format(user.id)
+    overlay = cache.get(key)
+    if overlay is not None:
+        counters['overlay_hits'] += 1
+        return overlay
+    overlay = {
+        'is_favorited': set(
+            Favorite.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)
+        ),
+        'is_in_shopping_cart': set(
+            ShoppingCart.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)
+        ),
+        'is_subscribed': set(
+            Subscription.objects.filter(
+                user=user
+            ).values_list('author_id', flat=True)
+        ),
+    }
+    cache.set(key, overlay, settings.FEED_CACHE_TIMEOUT)
+    counters['overlay_misses'] += 1
+    return overlay
+
+
+def build_feed(recipe_ids, request):
+    counters = Counter()
+    fragments = get_fragments(recipe_ids, request, counters)
+    if request.user.is_authenticated:
+        overlay = get_overlay(request.user, counters)
+    else:
+        overlay = None
+    feed = []
+    for recipe_id in recipe_ids:
+        if recipe_id not in fragments:
+            continue
+        recipe = dict(fragments[recipe_id])
+        author = dict(recipe['author'])
+        if overlay is not None:
+            recipe['is_favorited'] = recipe_id in overlay['is_favorited']
+            recipe['is_in_shopping_cart'] = (
+                recipe_id in overlay['is_in_shopping_cart']
+            )
+            author['is_subscribed'] = author['id'] in overlay['is_subscribed']
+        recipe['author'] = author
+        feed.append(recipe)
+    stats.update(counters)
+    return feed, counters
+
+
+def invalidate_fragments(recipe_ids):
+    version = fragment_version()
+    cache.delete_many(
+        [FRAGMENT_KEY.format(version, recipe_id) for recipe_id in recipe_ids]
+    )
+
+
+def invalidate_overlay(user_id):
+    cache.delete(OVERLAY_KEY.format(user_id))
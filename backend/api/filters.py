@@ -1,7 +1,12 @@
 from django_filters import rest_framework as filters
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, Recipe, Tag
 from rest_framework.filters import SearchFilter
 
+from api.recipe_search import search_recipes
+
+ORDERING_POPULAR = 'popular'
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-pk')
+
 
 class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
@@ -16,15 +21,31 @@ class IngredientFilter(filters.FilterSet):
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter('tags__slug')
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=((ORDERING_POPULAR, 'Популярные'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ordering'
+        ]
 
     def filter_is_favorited(self, queryset, name, value):
         if value:
@@ -35,3 +56,9 @@ class RecipeFilter(filters.FilterSet):
         if value:
             return queryset.filter(shoppingcarts__user=self.request.user)
         return queryset.exclude(shoppingcarts__user=self.request.user)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*POPULAR_ORDERING)
@@ -0,0 +1,136 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+
+from api.tasks import task
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'recipes/thumbnails/'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def run_logged(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта')
+
+
+class SyncBackend:
+    def submit(self, func, *args):
+        run_logged(func, *args)
+
+
+class ThreadPoolBackend:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PIPELINE_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(self.run, func, *args)
+
+    @staticmethod
+    def run(func, *args):
+        try:
+            run_logged(func, *args)
+        finally:
+            connection.close()
+
+
+class TaskBackend:
+    def submit(self, func, *args):
+        func.delay(*args)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.IMAGE_PIPELINE_BACKEND)()
+        return _backend
+
+
+def thumbnail_name(image_name, width, image_format):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{THUMBNAILS_DIR}{stem}_{width}.{EXTENSIONS[image_format]}'
+
+
+def get_thumbnail_urls(recipe, request=None):
+    if not recipe.image or not recipe.thumbnails_ready:
+        return None
+    urls = {}
+    for image_format in settings.RECIPE_THUMBNAIL_FORMATS:
+        urls[image_format] = {}
+        for width in settings.RECIPE_THUMBNAIL_SIZES:
+            url = default_storage.url(
+                thumbnail_name(recipe.image.name, width, image_format)
+            )
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[image_format][str(width)] = url
+    return urls
+
+
+def schedule_thumbnails(recipe):
+    if not recipe.image:
+        return
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_backend().submit(make_thumbnails, recipe_id, image_name)
+    )
+
+
+def save_thumbnail(image, name, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(
+        buffer,
+        format=image_format,
+        quality=settings.RECIPE_THUMBNAIL_QUALITY
+    )
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+@task
+def make_thumbnails(recipe_id, image_name):
+    with default_storage.open(image_name) as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for width in settings.RECIPE_THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, width))
+        for image_format in settings.RECIPE_THUMBNAIL_FORMATS:
+            save_thumbnail(
+                thumbnail,
+                thumbnail_name(image_name, width, image_format),
+                image_format
+            )
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=image_name
+    ).update(thumbnails_ready=True)
+    if updated:
+        from api.feed import invalidate_fragments
+        invalidate_fragments([recipe_id])
@@ -0,0 +1,106 @@
+import threading
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, When
+from recipes.models import Ingredient
+
+POSTGRES_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+    'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+
+
+class IngredientIndex:
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            (
+                (
+                    name.casefold(),
+                    {'id': pk, 'name': name, 'measurement_unit': unit}
+                )
+                for pk, name, unit in ingredients
+            ),
+            key=itemgetter(0)
+        )
+        self.keys = [key for key, _ in self.items]
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit=None):
+        query = query.casefold()
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        result = [item for _, item in self.items[start:end]]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for position, key in enumerate(self.keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(self.items[position][1])
+            if len(result) == limit:
+                break
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if (
+            _index is None
+            or time.monotonic() - _index.built_at
+            > settings.INGREDIENT_INDEX_TIMEOUT
+        ):
+            _index = IngredientIndex(Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ))
+        return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def search_database(query, limit=None):
+    ingredients = Ingredient.objects.filter(
+        name__icontains=query
+    ).annotate(
+        prefix=Case(
+            When(name__istartswith=query, then=0),
+            default=1,
+            output_field=IntegerField()
+        )
+    ).order_by('prefix', 'name').values('id', 'name', 'measurement_unit')
+    if limit is not None:
+        ingredients = ingredients[:limit]
+    return list(ingredients)
+
+
+def search_ingredients(query):
+    limit = settings.INGREDIENT_SEARCH_LIMIT
+    if settings.INGREDIENT_SEARCH_BACKEND == 'database':
+        return search_database(query, limit)
+    return get_index().search(query, limit)
+
+
+def create_postgres_indexes(using):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for statement in POSTGRES_INDEXES:
+            cursor.execute(statement)
@@ -0,0 +1,251 @@
+import json
+import random
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import CustomUser
+
+PERCENTILES = (50, 95, 99)
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+def percentile(values, rank):
+    ordered = sorted(values)
+    position = max(0, round(rank / 100 * len(ordered)) - 1)
+    return ordered[position]
+
+
+class Scenarios:
+    def __init__(self, user, rng):
+        self.rng = rng
+        self.user = user
+        self.recipes = list(Recipe.objects.values_list('pk', flat=True))
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        self.ingredients = list(Ingredient.objects.values_list('pk', 'name'))
+        self.tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        self.own_recipes = []
+
+    def recipe_list(self):
+        return 'get', '/api/recipes/', None
+
+    def recipe_list_filtered(self):
+        return 'get', '/api/recipes/', {
+            'tags': self.rng.sample(self.tags, 1), 'is_favorited': 1
+        }
+
+    def recipe_list_keyset(self):
+        return 'get', '/api/recipes/', {'cursor': ''}
+
+    def recipe_search(self):
+        name = self.rng.choice(self.ingredients)[1]
+        return 'get', '/api/recipes/', {'search': name.split()[0]}
+
+    def recipe_detail(self):
+        return 'get', f'/api/recipes/{self.rng.choice(self.recipes)}/', None
+
+    def subscriptions(self):
+        return 'get', '/api/users/subscriptions/', None
+
+    def ingredient_search(self):
+        name = self.rng.choice(self.ingredients)[1]
+        return 'get', '/api/ingredients/', {'name': name[:3]}
+
+    def pantry(self):
+        ingredients = self.rng.sample(self.ingredients, 10)
+        return 'get', '/api/recipes/pantry/', {
+            'ingredients': ','.join(str(pk) for pk, _ in ingredients)
+        }
+
+    def shopping_cart(self):
+        return 'get', '/api/recipes/download_shopping_cart/', None
+
+    def recipe_data(self):
+        return {
+            'name': f'Бенчмарк {self.rng.randint(0, 10 ** 6)}',
+            'text': 'Рецепт для нагрузочного теста.',
+            'cooking_time': self.rng.randint(5, 120),
+            'tags': self.rng.sample(self.tag_ids, 1),
+            'ingredients': [
+                {'id': pk, 'amount': self.rng.randint(1, 500)}
+                for pk, _ in self.rng.sample(self.ingredients, 8)
+            ],
+        }
+
+    def recipe_create(self):
+        data = self.recipe_data()
+        data['image'] = IMAGE
+        return 'post', '/api/recipes/', data
+
+    def recipe_patch(self):
+        if not self.own_recipes:
+            return self.recipe_create()
+        data = self.recipe_data()
+        return 'patch', f'/api/recipes/{self.own_recipes[0]}/', data
+
+
+SCENARIOS = (
+    'recipe_list',
+    'recipe_list_filtered',
+    'recipe_list_keyset',
+    'recipe_search',
+    'recipe_detail',
+    'subscriptions',
+    'ingredient_search',
+    'pantry',
+    'shopping_cart',
+    'recipe_create',
+    'recipe_patch',
+)
+
+
+class Command(BaseCommand):
+    help = 'Замер задержек и количества запросов к API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=100,
+            help='Количество замеров на сценарий.'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Количество прогревочных запросов на сценарий.'
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=SCENARIOS,
+            help='Сценарий для запуска, по умолчанию все.'
+        )
+        parser.add_argument(
+            '--user',
+            help='Почта пользователя, по умолчанию самый активный.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Метка запуска, например хеш коммита.'
+        )
+        parser.add_argument('--output', help='Путь к JSON-отчёту.')
+        parser.add_argument(
+            '--commit',
+            action='store_true',
+            help='Сохранить изменения, сделанные сценариями записи.'
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_HOST='localhost',
+            HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+        scenarios = Scenarios(user, random.Random(options['seed']))
+        if not scenarios.recipes or not scenarios.ingredients:
+            raise CommandError(
+                'Нет данных, сначала выполните команду generate_data.'
+            )
+        report = {
+            'label': options['label'],
+            'database': connection.vendor,
+            'recipes': len(scenarios.recipes),
+            'users': CustomUser.objects.count(),
+            'scenarios': {},
+        }
+        with transaction.atomic():
+            for name in options['scenario'] or SCENARIOS:
+                report['scenarios'][name] = self.run(
+                    client, scenarios, name,
+                    options['warmup'], options['requests']
+                )
+                self.write(name, report['scenarios'][name])
+            images = list(Recipe.objects.filter(
+                pk__in=scenarios.own_recipes
+            ).values_list('image', flat=True))
+            if not options['commit']:
+                transaction.set_rollback(True)
+        if not options['commit']:
+            for image in images:
+                default_storage.delete(image)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def get_user(email):
+        if email:
+            user = CustomUser.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'Пользователь {email} не найден.')
+            return user
+        user = CustomUser.objects.annotate(
+            carts=Count('shoppingcarts', distinct=True),
+            subscriptions=Count('subscribed_to', distinct=True)
+        ).order_by('-carts', '-subscriptions').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        return user
+
+    @staticmethod
+    def request(client, scenarios, name):
+        method, path, data = getattr(scenarios, name)()
+        kwargs = {}
+        if method != 'get':
+            data = json.dumps(data)
+            kwargs['content_type'] = 'application/json'
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if method == 'post' and response.status_code == 201:
+            scenarios.own_recipes.append(response.json()['id'])
+        return elapsed, len(queries), response.status_code
+
+    def run(self, client, scenarios, name, warmup, count):
+        for _ in range(warmup):
+            self.request(client, scenarios, name)
+        latencies = []
+        queries = []
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            elapsed, query_count, status = self.request(
+                client, scenarios, name
+            )
+            latencies.append(elapsed * 1000)
+            queries.append(query_count)
+            errors += status >= 400
+        total = time.perf_counter() - start
+        result = {
+            'requests': count,
+            'errors': errors,
+            'throughput': round(count / total, 2),
+            'queries': round(sum(queries) / count, 2),
+            'queries_max': max(queries),
+        }
+        for rank in PERCENTILES:
+            result[f'p{rank}'] = round(percentile(latencies, rank), 2)
+        return result
+
+    def write(self, name, result):
+        self.stdout.write(
+            f"{name}: p50 {result['p50']} мс, p95 {result['p95']} мс, "
+            f"p99 {result['p99']} мс, запросов к БД {result['queries']}, "
+            f"{result['throughput']} запр/с, ошибок {result['errors']}"
+        )
@@ -0,0 +1,184 @@
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.benchmark import (
+    PERCENTILES,
+    Command as Benchmark,
+    percentile
+)
+
+RECEIVE_BUFFER = 4096
+
+
+class SlowClient(threading.Thread):
+    def __init__(self, address, request, send_delay, read_delay, stop):
+        super().__init__(daemon=True)
+        self.address = address
+        self.request = request
+        self.send_delay = send_delay
+        self.read_delay = read_delay
+        self.stop = stop
+        self.completed = 0
+        self.errors = 0
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self.fetch()
+                self.completed += 1
+            except OSError:
+                self.errors += 1
+                time.sleep(self.read_delay)
+
+    def fetch(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER
+            )
+            sock.settimeout(60)
+            sock.connect(self.address)
+            for line in self.request.splitlines(keepends=True):
+                sock.sendall(line)
+                time.sleep(self.send_delay)
+            while not self.stop.is_set():
+                if not sock.recv(RECEIVE_BUFFER):
+                    return
+                time.sleep(self.read_delay)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержек быстрых запросов при медленных клиентах. '
+        'Запускается против gunicorn напрямую, минуя nginx.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=20,
+            help='Количество одновременных медленных клиентов.'
+        )
+        parser.add_argument(
+            '--slow-path',
+            default='/api/recipes/download_shopping_cart/?format=txt',
+            help='Адрес, который скачивают медленные клиенты.'
+        )
+        parser.add_argument(
+            '--probe-path',
+            default='/api/tags/',
+            help='Адрес, на котором замеряется задержка.'
+        )
+        parser.add_argument('--probes', type=int, default=100)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.1,
+            help='Пауза между замерами, с.'
+        )
+        parser.add_argument(
+            '--send-delay',
+            type=float,
+            default=0.2,
+            help='Пауза между строками запроса медленного клиента, с.'
+        )
+        parser.add_argument(
+            '--read-delay',
+            type=float,
+            default=0.2,
+            help='Пауза между чтениями ответа медленного клиента, с.'
+        )
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument(
+            '--user',
+            help='Почта пользователя, по умолчанию самый активный.'
+        )
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Метка запуска, например класс воркеров gunicorn.'
+        )
+        parser.add_argument('--output', help='Путь к JSON-отчёту.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживаются только адреса http://.')
+        address = (url.hostname, url.port or 80)
+        user = Benchmark.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = (
+            f'Host: {url.hostname}\r\n'
+            f'Authorization: Token {token.key}\r\n'
+            'Connection: close\r\n'
+        )
+        stop = threading.Event()
+        clients = [
+            SlowClient(
+                address,
+                (
+                    f"GET {options['slow_path']} HTTP/1.1\r\n"
+                    f'{headers}\r\n'
+                ).encode(),
+                options['send_delay'],
+                options['read_delay'],
+                stop
+            )
+            for _ in range(options['slow_clients'])
+        ]
+        for client in clients:
+            client.start()
+        probe = (
+            f"GET {options['probe_path']} HTTP/1.1\r\n{headers}\r\n"
+        ).encode()
+        latencies = []
+        timeouts = 0
+        try:
+            for _ in range(options['probes']):
+                time.sleep(options['interval'])
+                elapsed = self.probe(address, probe, options['timeout'])
+                if elapsed is None:
+                    timeouts += 1
+                else:
+                    latencies.append(elapsed * 1000)
+        finally:
+            stop.set()
+        report = {
+            'label': options['label'],
+            'slow_clients': options['slow_clients'],
+            'probes': options['probes'],
+            'timeouts': timeouts,
+            'slow_completed': sum(client.completed for client in clients),
+            'slow_errors': sum(client.errors for client in clients),
+        }
+        for rank in PERCENTILES:
+            report[f'p{rank}'] = (
+                round(percentile(latencies, rank), 2) if latencies else None
+            )
+        self.stdout.write(
+            f"{options['label'] or options['url']}: "
+            f"p50 {report['p50']} мс, p95 {report['p95']} мс, "
+            f"p99 {report['p99']} мс, таймаутов {timeouts}"
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def probe(address, request, timeout):
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(address, timeout) as sock:
+                sock.sendall(request)
+                while sock.recv(64 * 1024):
+                    pass
+        except OSError:
+            return None
+        return time.perf_counter() - start
@@ -0,0 +1,74 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from recipes.models import Tag
+
+from api.management.commands.benchmark import PERCENTILES, percentile
+
+MODES = ('reconnect', 'persistent', 'health_check')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер накладных расходов на соединение с базой данных: '
+        'новое соединение на запрос, постоянное соединение '
+        'и постоянное соединение с проверкой.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--mode',
+            action='append',
+            choices=MODES,
+            help='Режим для запуска, по умолчанию все.'
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Метка запуска, например адрес pgbouncer.'
+        )
+        parser.add_argument('--output', help='Путь к JSON-отчёту.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        report = {
+            'label': options['label'],
+            'database': connection.vendor,
+            'host': connection.settings_dict.get('HOST', ''),
+            'modes': {},
+        }
+        for mode in options['mode'] or MODES:
+            latencies = [
+                self.request(connection, mode) * 1000
+                for _ in range(options['requests'])
+            ]
+            result = {
+                rank: round(percentile(latencies, rank), 3)
+                for rank in PERCENTILES
+            }
+            report['modes'][mode] = {
+                f'p{rank}': value for rank, value in result.items()
+            }
+            self.stdout.write(
+                f'{mode}: ' + ', '.join(
+                    f'p{rank} {value} мс' for rank, value in result.items()
+                )
+            )
+        connection.close()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def request(connection, mode):
+        if mode == 'reconnect':
+            connection.close()
+        start = time.perf_counter()
+        if mode == 'health_check' and connection.connection is not None:
+            connection.is_usable()
+        list(Tag.objects.using(connection.alias))
+        return time.perf_counter() - start
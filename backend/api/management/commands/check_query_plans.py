@@ -0,0 +1,119 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription
+)
+from users.models import CustomUser
+
+from api.shopping_cart import shopping_cart_items
+
+SAMPLE_ID = 1
+
+
+def hot_queries():
+    return (
+        ('Избранное пользователя', Recipe.objects.filter(
+            favorites__user=SAMPLE_ID
+        )),
+        ('Рецепты в списке покупок', Recipe.objects.filter(
+            shoppingcarts__user=SAMPLE_ID
+        )),
+        ('Список покупок', shopping_cart_items(SAMPLE_ID)),
+        ('Флаги избранного', Favorite.objects.filter(
+            user=SAMPLE_ID
+        ).values_list('recipe_id', flat=True)),
+        ('Флаги списка покупок', ShoppingCart.objects.filter(
+            user=SAMPLE_ID
+        ).values_list('recipe_id', flat=True)),
+        ('Подписки пользователя', CustomUser.objects.filter(
+            subscribed_by__user=SAMPLE_ID
+        )),
+        ('Подписчики автора', Subscription.objects.filter(
+            author=SAMPLE_ID
+        )),
+        ('Ингредиенты рецепта', RecipeIngredient.objects.filter(
+            recipe=SAMPLE_ID
+        )),
+        ('Рецепты автора', Recipe.objects.filter(
+            author=SAMPLE_ID
+        ).order_by('-pub_date')[:3]),
+        ('Рецепты по продуктам', RecipeIngredient.objects.filter(
+            ingredient__in=[SAMPLE_ID, SAMPLE_ID + 1]
+        ).values_list('recipe_id', flat=True)),
+    )
+
+
+def postgres_scans(plan):
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from postgres_scans(child)
+
+
+def explain_postgres(cursor, sql, params):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]['Plan']
+    return json.dumps(plan, indent=2), list(postgres_scans(plan))
+
+
+def sqlite_scans(details):
+    tables = connection.introspection.table_names()
+    for detail in details:
+        words = detail.replace('SCAN TABLE ', 'SCAN ').split()
+        if words[0] == 'SCAN' and words[1] in tables and 'USING' not in words:
+            yield words[1]
+
+
+def explain_sqlite(cursor, sql, params):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    details = [row[-1] for row in cursor.fetchall()]
+    return '\n'.join(details), list(sqlite_scans(details))
+
+
+EXPLAIN = {
+    'postgresql': explain_postgres,
+    'sqlite': explain_sqlite,
+}
+
+
+class Command(BaseCommand):
+    help = 'Проверка планов горячих запросов на полное сканирование таблиц.'
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(
+                f'Проверка планов не поддерживается для {connection.vendor}.'
+            )
+        explain = EXPLAIN[connection.vendor]
+        failed = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in hot_queries():
+                sql, params = queryset.query.sql_with_params()
+                plan, scans = explain(cursor, sql, params)
+                if options['verbosity'] > 1:
+                    self.stdout.write(plan)
+                if scans:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: полное сканирование {", ".join(scans)}'
+                    ))
+                else:
+                    self.stdout.write(f'{name}: OK')
+        if failed:
+            raise CommandError(
+                f'Запросов с полным сканированием: {len(failed)}.'
+            )
+        self.stdout.write(
+            self.style.SUCCESS('Все запросы используют индексы.')
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.bulk import export_recipes
+
+
+class Command(BaseCommand):
+    help = 'Экспорт всех рецептов в NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Путь к файлу, по умолчанию вывод в stdout.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Количество рецептов, читаемых за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        chunks = export_recipes(chunk_size=options['chunk_size'])
+        if not options['path']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['path'], 'w', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from users.models import CustomUser
+
+from api.bulk import import_recipes, read_records
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из NDJSON или JSON-массива.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с рецептами.')
+        parser.add_argument(
+            '--author',
+            required=True,
+            help='Электронная почта автора рецептов.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Количество рецептов в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = CustomUser.objects.get(email=options['author'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f'Пользователь {options["author"]} не найден.')
+
+        created = failed = 0
+        with open(options['path'], encoding='utf-8') as f:
+            try:
+                if f.read(1) == '[':
+                    f.seek(0)
+                    records = json.load(f)
+                else:
+                    f.seek(0)
+                    records = read_records(f)
+                for result in import_recipes(
+                    records, author, options['batch_size']
+                ):
+                    if 'id' in result:
+                        created += 1
+                        continue
+                    failed += 1
+                    self.stderr.write(
+                        f'Рецепт {result["index"]}: {result["errors"]}'
+                    )
+            except ValueError as error:
+                raise CommandError(f'Некорректный файл: {error}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Импорт завершён: создано {created}, ошибок {failed}.'
+            )
+        )
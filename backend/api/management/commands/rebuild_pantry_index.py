@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.pantry import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроение индекса подбора рецептов по продуктам.'
+
+    def handle(self, *args, **options):
+        index = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов в индексе продуктов: {len(index)}.'
+        ))
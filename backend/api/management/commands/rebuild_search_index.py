@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.recipe_search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроение поискового индекса рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Количество рецептов, обновляемых за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_search_index(options['chunk_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Рецептов в поисковом индексе: {total}.')
+        )
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import ShoppingCart, ShoppingListItem
+
+from api.shopping_cart import refresh_shopping_lists, shopping_cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Сверка списков покупок с содержимым корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list(
+                'user_id', flat=True
+            ).distinct())
+            | set(ShoppingListItem.objects.values_list(
+                'user_id', flat=True
+            ).distinct())
+        )
+        stale = set()
+        chunk_size = settings.SHOPPING_LIST_CHUNK_SIZE
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            actual = set(shopping_cart_totals(chunk))
+            stored = set(ShoppingListItem.objects.filter(
+                user__in=chunk
+            ).values_list('user_id', 'ingredient_id', 'total_amount'))
+            stale.update(user_id for user_id, _, _ in actual ^ stored)
+        if not options['dry_run']:
+            refresh_shopping_lists(sorted(stale))
+        self.stdout.write(
+            f'Пользователей: {len(user_ids)}, '
+            f'списков с расхождениями: {len(stale)}'
+        )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Списки покупок сверены.'))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription
+)
+from users.models import CustomUser
+
+CHUNK_SIZE = 500
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (Recipe, 'ingredients_count', RecipeIngredient, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'subscribers_count', Subscription, 'author'),
+)
+
+
+def actual_count(related, field):
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Сверка денормализованных счётчиков с данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения.'
+        )
+
+    def handle(self, *args, **options):
+        for model, name, related, field in COUNTERS:
+            stale = list(
+                model.objects.annotate(
+                    actual=actual_count(related, field)
+                ).exclude(
+                    **{name: F('actual')}
+                ).values_list('pk', flat=True)
+            )
+            if not options['dry_run']:
+                for start in range(0, len(stale), CHUNK_SIZE):
+                    model.objects.filter(
+                        pk__in=stale[start:start + CHUNK_SIZE]
+                    ).update(**{name: actual_count(related, field)})
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{name}: '
+                f'расхождений {len(stale)}'
+            )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
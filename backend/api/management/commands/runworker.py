@@ -0,0 +1,118 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.tasks import KILL_GRACE, SyncBackend, execute, get_backend
+
+MAINTENANCE_INTERVAL = 60
+
+
+def work(stop, poll_interval, burst, deadline):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_IGN)
+    backend = get_backend()
+    maintenance = 0
+    try:
+        while not stop.is_set():
+            if time.monotonic() - maintenance > MAINTENANCE_INTERVAL:
+                backend.requeue_stale()
+                backend.purge()
+                maintenance = time.monotonic()
+            message = backend.pop()
+            if message is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+                continue
+            deadline.value = time.monotonic() + settings.TASK_TIMEOUT
+            try:
+                execute(backend, message, settings.TASK_TIMEOUT)
+            finally:
+                deadline.value = 0
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запуск обработчика фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.TASK_WORKER_PROCESSES,
+            help='Количество процессов-обработчиков.'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.TASK_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, с.'
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выполнить задачи из очереди и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        if isinstance(get_backend(), SyncBackend):
+            raise CommandError(
+                'Задачи выполняются синхронно, '
+                'укажите TASK_QUEUE_BACKEND с очередью.'
+            )
+        self.stopping = False
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.shutdown)
+        stop = multiprocessing.Event()
+        connections.close_all()
+        worker_args = (stop, options['poll_interval'], options['burst'])
+        processes = [
+            self.start(worker_args) for _ in range(options['processes'])
+        ]
+        self.stdout.write(
+            f'Запущено обработчиков: {len(processes)}, '
+            f'очередь: {settings.TASK_QUEUE_BACKEND}'
+        )
+        while not self.stopping:
+            for process in processes:
+                self.kill_overdue(process)
+            alive = [process for process in processes if process.is_alive()]
+            if options['burst'] and not alive:
+                break
+            if not options['burst']:
+                for _ in range(len(processes) - len(alive)):
+                    alive.append(self.start(worker_args))
+            processes = alive
+            time.sleep(1)
+        stop.set()
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Обработчики остановлены.'))
+
+    def shutdown(self, signum, frame):
+        self.stopping = True
+
+    def kill_overdue(self, process):
+        deadline = process.deadline.value
+        if deadline and time.monotonic() > deadline + KILL_GRACE:
+            self.stderr.write(
+                f'Обработчик {process.pid} превысил время выполнения '
+                'задачи и будет остановлен.'
+            )
+            process.kill()
+            process.join()
+
+    @staticmethod
+    def start(worker_args):
+        deadline = multiprocessing.Value('d', 0.0)
+        process = multiprocessing.Process(
+            target=work, args=(*worker_args, deadline)
+        )
+        process.deadline = deadline
+        process.start()
+        return process
@@ -0,0 +1,260 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from api.authentication import stats as token_stats
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.timers = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+        self.budget_exceeded = 0
+
+    def observe(self, duration, metrics, size):
+        self.requests += 1
+        self.duration += duration
+        for position, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[position] += 1
+        self.queries += metrics.queries
+        self.db_time += metrics.db_time
+        self.serializer_time += metrics.timers.get('serializer', 0.0)
+        self.response_bytes += size
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+
+    def observe(self, view, duration, metrics, size):
+        with self.lock:
+            self.views[view].observe(duration, metrics, size)
+
+    def budget_exceeded(self, view):
+        with self.lock:
+            self.views[view].budget_exceeded += 1
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self, counters):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# TYPE foodgram_request_duration_seconds histogram',
+            ]
+            for view, data in views:
+                for bound, count in zip(BUCKETS, data.buckets):
+                    lines.append(
+                        'foodgram_request_duration_seconds_bucket'
+                        f'{{view="{view}",le="{bound}"}} {count}'
+                    )
+                lines += [
+                    'foodgram_request_duration_seconds_bucket'
+                    f'{{view="{view}",le="+Inf"}} {data.requests}',
+                    'foodgram_request_duration_seconds_sum'
+                    f'{{view="{view}"}} {data.duration}',
+                    'foodgram_request_duration_seconds_count'
+                    f'{{view="{view}"}} {data.requests}',
+                ]
+            for name, attribute in (
+                ('foodgram_db_queries_total', 'queries'),
+                ('foodgram_db_duration_seconds_total', 'db_time'),
+                (
+                    'foodgram_serializer_duration_seconds_total',
+                    'serializer_time'
+                ),
+                ('foodgram_response_bytes_total', 'response_bytes'),
+                ('foodgram_query_budget_exceeded_total', 'budget_exceeded'),
+            ):
+                lines.append(f'# TYPE {name} counter')
+                lines += [
+                    f'{name}{{view="{view}"}} {getattr(data, attribute)}'
+                    for view, data in views
+                ]
+        for name, values in counters.items():
+            lines.append(f'# TYPE {name} counter')
+            lines += [
+                f'{name}{{result="{result}"}} {count}'
+                for result, count in sorted(values.items())
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextmanager
+def timer(name):
+    metrics = getattr(_current, 'metrics', None)
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timers[name] += time.perf_counter() - start
+
+
+@contextmanager
+def measure(metrics):
+    _current.metrics = metrics
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield
+    finally:
+        _current.metrics = None
+
+
+def get_view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    view = match.func
+    actions = getattr(view, 'actions', None)
+    if actions:
+        method = request.method.lower()
+        return f'{view.cls.__name__}.{actions.get(method, method)}'
+    if hasattr(view, 'cls'):
+        return view.cls.__name__
+    return f'{view.__module__}.{view.__name__}'
+
+
+def server_timing(duration, metrics):
+    entries = [
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} SQL"',
+    ]
+    entries += [
+        f'{name};dur={value * 1000:.1f}'
+        for name, value in sorted(metrics.timers.items())
+    ]
+    entries.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def check_budget(view, metrics):
+    budget = settings.QUERY_BUDGETS.get(view)
+    if budget is None or metrics.queries <= budget:
+        return
+    registry.budget_exceeded(view)
+    message = (
+        f'{view}: {metrics.queries} SQL-запросов при бюджете {budget}'
+    )
+    if settings.QUERY_BUDGET_ACTION == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with measure(metrics):
+            response = self.get_response(request)
+        view = get_view_name(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, view, start, metrics
+            )
+            return response
+        duration = time.perf_counter() - start
+        registry.observe(view, duration, metrics, len(response.content))
+        response['Server-Timing'] = server_timing(duration, metrics)
+        check_budget(view, metrics)
+        return response
+
+    @staticmethod
+    def stream(content, view, start, metrics):
+        content = iter(content)
+        size = 0
+        try:
+            while True:
+                with measure(metrics):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe(
+                view, time.perf_counter() - start, metrics, size
+            )
+        check_budget(view, metrics)
+
+    def process_template_response(self, request, response):
+        metrics = getattr(_current, 'metrics', None)
+        if metrics is None:
+            return response
+        start = time.perf_counter()
+
+        def rendered(response):
+            metrics.timers['render'] += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token or request.META.get(
+        'HTTP_AUTHORIZATION'
+    ) != f'Bearer {token}':
+        return HttpResponseForbidden()
+    from api.feed import stats as feed_stats
+    from api.tasks import render_metrics
+    return HttpResponse(
+        registry.render({
+            'foodgram_feed_cache_total': feed_stats,
+            'foodgram_token_cache_total': token_stats,
+        }) + render_metrics(),
+        content_type=CONTENT_TYPE
+    )
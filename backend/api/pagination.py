@@ -0,0 +1,163 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+
+
+def estimate_count(queryset):
+    if not isinstance(queryset, QuerySet):
+        return queryset.count()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = view.keyset_ordering
+        queryset = queryset.order_by(*ordering)
+        self.count = self.get_count(queryset, request)
+
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        if position is not None:
+            if (
+                not isinstance(position, list)
+                or len(position) != len(ordering)
+            ):
+                raise NotFound(self.invalid_cursor_message)
+            position = self.to_python(queryset, ordering, position)
+            queryset = self.filter_after(queryset, ordering, position)
+        items = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            self.next_position = [
+                self.get_value(items[-1], field.lstrip('-'))
+                for field in ordering
+            ]
+        return items
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, COUNT_NONE)
+        if mode == COUNT_EXACT:
+            return queryset.count()
+        if mode == COUNT_ESTIMATE:
+            return estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def get_field(queryset, name):
+        if not isinstance(queryset, QuerySet):
+            return queryset.fields[name]
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def to_python(self, queryset, ordering, position):
+        values = []
+        for field, value in zip(ordering, position):
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            field = self.get_field(queryset, field.lstrip('-'))
+            try:
+                values.append(field.to_python(value))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def get_value(item, field):
+        value = getattr(item, field)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def after(ordering, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def filter_after(self, queryset, ordering, position):
+        if not isinstance(queryset, QuerySet):
+            return queryset.after(position)
+        return queryset.filter(self.after(ordering, position))
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()
+        ).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return None
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
@@ -0,0 +1,421 @@
+import os
+import pickle
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from copy import copy
+from heapq import merge
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, models
+from recipes.models import RecipeIngredient
+
+from api.tasks import batch_on_commit, merge_batch
+
+ORDERING = ('-coverage', 'missing', '-pk')
+SEQUENCE_KEY = 'pantry:sequence'
+CHANGES_KEY = 'pantry:changes:{}'
+CHUNK_BITS = 4096
+MAX_BYTE = 255
+SINGLE_COUNTS = bytes(range(2))
+QUERY_CHUNK_SIZE = 500
+
+PantryRow = namedtuple('PantryRow', ('pk', 'coverage', 'missing'))
+
+
+def to_bits(positions):
+    data = bytearray((max(positions, default=-1) + 8) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def count_bits(bits):
+    return bin(bits).count('1')
+
+
+def iterate_bits(bits):
+    while bits:
+        low = max(bits.bit_length() - CHUNK_BITS, 0)
+        chunk = bits >> low
+        bits &= (1 << low) - 1
+        while chunk:
+            top = chunk.bit_length() - 1
+            yield low + top
+            chunk ^= 1 << top
+
+
+BIT_TABLES = [
+    [
+        bytes((count >> weight & 1) << offset for count in range(256))
+        for offset in range(8)
+    ]
+    for weight in range(8)
+]
+
+
+def pack_bits(counts, weight):
+    bits = 0
+    for offset, table in enumerate(BIT_TABLES[weight]):
+        bits |= int.from_bytes(counts[offset::8].translate(table), 'little')
+    return bits
+
+
+def add_bits(planes, bits, weight=0):
+    while bits:
+        if weight == len(planes):
+            planes.append(bits)
+            return
+        planes[weight], bits = planes[weight] ^ bits, planes[weight] & bits
+        weight += 1
+
+
+class PantryRanking:
+    ordered = True
+    fields = {
+        'pk': models.IntegerField(),
+        'coverage': models.FloatField(),
+        'missing': models.IntegerField(),
+    }
+
+    def __init__(self, index, ingredient_ids):
+        self.planes = []
+        sparse = []
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in index.dense:
+                add_bits(self.planes, index.dense[ingredient_id])
+            elif ingredient_id in index.sparse:
+                sparse.append(index.sparse[ingredient_id])
+        for start in range(0, len(sparse), MAX_BYTE):
+            self.add_sparse(sparse[start:start + MAX_BYTE], len(index.counts))
+        self.matched = 0
+        for plane in self.planes:
+            self.matched |= plane
+        self.by_count = {}
+        for count, bits in index.by_count.items():
+            if bits & self.matched:
+                self.by_count[count] = bits & self.matched
+        self.limit = min(len(ingredient_ids), (1 << len(self.planes)) - 1)
+        self.equal = {}
+        self.position = None
+
+    def add_sparse(self, postings, size):
+        counts = bytearray(size)
+        for positions in postings:
+            for position in positions:
+                counts[position] += 1
+        top = max(counts.translate(None, SINGLE_COUNTS), default=1)
+        for weight in range(top.bit_length()):
+            add_bits(self.planes, pack_bits(counts, weight), weight)
+
+    def order_by(self, *ordering):
+        return self
+
+    def after(self, position):
+        ranking = copy(self)
+        ranking.position = position
+        return ranking
+
+    def count(self):
+        return count_bits(self.matched)
+
+    def matching(self, matched):
+        if matched not in self.equal:
+            bits = self.matched
+            for weight, plane in enumerate(self.planes):
+                if matched >> weight & 1:
+                    bits &= plane
+                else:
+                    bits ^= bits & plane
+            self.equal[matched] = bits
+        return self.equal[matched]
+
+    def groups(self):
+        pairs = merge(*(
+            [
+                ((-matched / count, count - matched), matched, count)
+                for matched in range(min(count, self.limit), 0, -1)
+            ]
+            for count in self.by_count
+        ))
+        for key, group in groupby(pairs, key=itemgetter(0)):
+            yield key, [(matched, count) for _, matched, count in group]
+
+    def rows(self, offset=0):
+        start, below = None, None
+        if self.position is not None:
+            coverage, missing, below = self.position
+            start = (-coverage, missing)
+        for key, pairs in self.groups():
+            if start is not None and key < start:
+                continue
+            bits = 0
+            for matched, count in pairs:
+                bits |= self.matching(matched) & self.by_count[count]
+            if key == start:
+                bits &= (1 << min(max(below, 0), bits.bit_length())) - 1
+            if offset:
+                size = count_bits(bits)
+                if offset >= size:
+                    offset -= size
+                    continue
+            for position in islice(iterate_bits(bits), offset, None):
+                yield PantryRow(position, -key[0], key[1])
+            offset = 0
+
+    def __iter__(self):
+        return self.rows()
+
+    def __getitem__(self, key):
+        start = key.start or 0
+        stop = None if key.stop is None else key.stop - start
+        return list(islice(self.rows(start), stop))
+
+
+class PantryIndex:
+
+    def __init__(self, postings, sequence):
+        self.sequence = sequence
+        self.saved_sequence = sequence
+        self.waiting_since = None
+        size = max(
+            (positions[-1] + 1 for positions in postings.values()),
+            default=0
+        )
+        self.counts = array('H', bytes(2 * size))
+        for positions in postings.values():
+            for position in positions:
+                self.counts[position] += 1
+        self.dense = {}
+        self.sparse = {}
+        for ingredient_id, positions in postings.items():
+            if len(positions) * settings.PANTRY_INDEX_DENSITY >= size:
+                self.dense[ingredient_id] = to_bits(positions)
+            else:
+                self.sparse[ingredient_id] = positions
+        by_count = defaultdict(list)
+        for position, count in enumerate(self.counts):
+            if count:
+                by_count[count].append(position)
+        self.by_count = {
+            count: to_bits(positions) for count, positions in by_count.items()
+        }
+
+    def __len__(self):
+        return sum(1 for count in self.counts if count)
+
+    @classmethod
+    def build(cls):
+        sequence = get_sequence()
+        postings = defaultdict(lambda: array('i'))
+        rows = RecipeIngredient.objects.using(DEFAULT_DB_ALIAS).order_by(
+            'recipe_id'
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows.iterator(
+            chunk_size=settings.PANTRY_INDEX_CHUNK_SIZE
+        ):
+            postings[ingredient_id].append(recipe_id)
+        return cls(postings, sequence)
+
+    def contains(self, ingredient_id, position):
+        if ingredient_id in self.dense:
+            return bool(self.dense[ingredient_id] >> position & 1)
+        positions = self.sparse.get(ingredient_id, ())
+        index = bisect_left(positions, position)
+        return index < len(positions) and positions[index] == position
+
+    def ingredients(self, position):
+        return {
+            ingredient_id
+            for ingredient_id in list(self.dense) + list(self.sparse)
+            if self.contains(ingredient_id, position)
+        }
+
+    def update_posting(self, ingredient_id, position, present):
+        if self.contains(ingredient_id, position) == present:
+            return
+        if ingredient_id in self.dense:
+            self.dense[ingredient_id] ^= 1 << position
+            return
+        positions = self.sparse.setdefault(ingredient_id, array('i'))
+        index = bisect_left(positions, position)
+        if present:
+            positions.insert(index, position)
+        else:
+            del positions[index]
+
+    def update_count(self, position, count):
+        if position >= len(self.counts):
+            self.counts.extend(
+                array('H', bytes(2 * (position + 1 - len(self.counts))))
+            )
+        previous = self.counts[position]
+        if previous == count:
+            return
+        if previous:
+            self.by_count[previous] ^= 1 << position
+            if not self.by_count[previous]:
+                del self.by_count[previous]
+        if count:
+            self.by_count[count] = self.by_count.get(count, 0) | (
+                1 << position
+            )
+        self.counts[position] = count
+
+    def apply(self, changes):
+        current = defaultdict(set)
+        recipe_ids = list(changes)
+        for start in range(0, len(recipe_ids), QUERY_CHUNK_SIZE):
+            current_rows = RecipeIngredient.objects.using(
+                DEFAULT_DB_ALIAS
+            ).filter(
+                recipe_id__in=recipe_ids[start:start + QUERY_CHUNK_SIZE]
+            ).values_list('recipe_id', 'ingredient_id')
+            for recipe_id, ingredient_id in current_rows:
+                current[recipe_id].add(ingredient_id)
+        for recipe_id, ingredient_ids in changes.items():
+            present = current[recipe_id]
+            if ingredient_ids is None:
+                ingredient_ids = self.ingredients(recipe_id)
+            for ingredient_id in present.union(ingredient_ids):
+                self.update_posting(
+                    ingredient_id, recipe_id, ingredient_id in present
+                )
+            self.update_count(recipe_id, len(present))
+
+    def refresh(self):
+        sequence = get_sequence()
+        if sequence == self.sequence:
+            return True
+        if not (
+            0 < sequence - self.sequence <= settings.PANTRY_INDEX_MAX_CHANGES
+        ):
+            return False
+        keys = [
+            CHANGES_KEY.format(number)
+            for number in range(self.sequence + 1, sequence + 1)
+        ]
+        found = cache.get_many(keys)
+        changes = {}
+        for key in keys:
+            if key not in found:
+                break
+            merge_batch(changes, found[key])
+            self.sequence += 1
+        self.apply(changes)
+        if self.sequence == sequence:
+            self.waiting_since = None
+        elif self.waiting_since is None:
+            self.waiting_since = time.monotonic()
+        elif (
+            time.monotonic() - self.waiting_since
+            > settings.PANTRY_CHANGES_WAIT
+        ):
+            return False
+        return True
+
+    def rank(self, ingredient_ids):
+        return PantryRanking(self, ingredient_ids)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_sequence():
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        sequence = time.time_ns()
+        if not cache.add(SEQUENCE_KEY, sequence, None):
+            sequence = cache.get(SEQUENCE_KEY, sequence)
+    return sequence
+
+
+def reset_sequence():
+    cache.set(SEQUENCE_KEY, time.time_ns(), None)
+
+
+def log_changes(changes):
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        reset_sequence()
+        return
+    cache.set(
+        CHANGES_KEY.format(sequence), changes, settings.PANTRY_CHANGES_TIMEOUT
+    )
+
+
+def schedule_pantry_update(recipe_id, ingredient_ids=()):
+    batch_on_commit(log_changes, {recipe_id: ingredient_ids})
+
+
+def load_index():
+    if not settings.PANTRY_INDEX_FILE:
+        return None
+    try:
+        with open(settings.PANTRY_INDEX_FILE, 'rb') as file:
+            index = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    index.saved_sequence = index.sequence
+    index.waiting_since = None
+    if not index.refresh():
+        return None
+    return index
+
+
+def save_index(index):
+    if not settings.PANTRY_INDEX_FILE:
+        return
+    temporary = f'{settings.PANTRY_INDEX_FILE}.{os.getpid()}'
+    with open(temporary, 'wb') as file:
+        pickle.dump(index, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, settings.PANTRY_INDEX_FILE)
+    index.saved_sequence = index.sequence
+
+
+def build_index():
+    index = PantryIndex.build()
+    save_index(index)
+    return index
+
+
+def rebuild_index():
+    reset_sequence()
+    return build_index()
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def rank_pantry(ingredient_ids):
+    global _index
+    with _index_lock:
+        if _index is None or not _index.refresh():
+            _index = load_index() or build_index()
+        elif (
+            _index.sequence - _index.saved_sequence
+            >= settings.PANTRY_INDEX_SAVE_CHANGES
+        ):
+            save_index(_index)
+        return _index.rank(ingredient_ids)
+
+
+def rank_recipes(queryset, ingredient_ids):
+    if (
+        settings.PANTRY_SEARCH_BACKEND == 'database'
+        or queryset.query.has_filters()
+    ):
+        return queryset.by_pantry(ingredient_ids).order_by(
+            *ORDERING
+        ).values_list('pk', 'coverage', 'missing', named=True)
+    return rank_pantry(ingredient_ids)
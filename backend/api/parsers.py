@@ -0,0 +1,20 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from api.bulk import read_records
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get(
+            'encoding', settings.DEFAULT_CHARSET
+        )
+        try:
+            return list(read_records(
+                line.decode(encoding) for line in stream
+            ))
+        except (UnicodeDecodeError, ValueError) as exc:
+            raise ParseError(f'NDJSON parse error - {exc}')
@@ -0,0 +1,180 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+from api.tasks import batch_on_commit, task
+
+SQLITE_TABLE = 'recipes_recipe_search'
+SQLITE_WEIGHTS = (1.0, 0.4, 0.2)
+ORDERING = ('-search_rank', '-pub_date', '-pk')
+
+POSTGRES_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+SQLITE_TABLES = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} '
+    'USING fts5(name, ingredients, text, '
+    "tokenize = 'unicode61 remove_diacritics 2')",
+)
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM {recipe_ingredient} '
+    'JOIN {ingredient} ON {ingredient}.id = '
+    '{recipe_ingredient}.ingredient_id '
+    'WHERE {recipe_ingredient}.recipe_id = {recipe}.id'
+)
+
+
+def ingredient_names(aggregate):
+    return INGREDIENT_NAMES.format(
+        aggregate=aggregate,
+        recipe=Recipe._meta.db_table,
+        recipe_ingredient=RecipeIngredient._meta.db_table,
+        ingredient=Ingredient._meta.db_table,
+    )
+
+
+def search_postgres(queryset, value):
+    query = SearchQuery(value, config=settings.RECIPE_SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=Cast(
+            SearchRank(F('search_vector'), query), FloatField()
+        )
+    ).order_by(*ORDERING)
+
+
+def search_sqlite(queryset, value):
+    terms = re.findall(r'\w+', value)
+    if not terms:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).none()
+    match = ' '.join(f'"{term}"*' for term in terms)
+    table = Recipe._meta.db_table
+    weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+    return queryset.annotate(
+        search_rank=RawSQL(
+            f'-bm25({SQLITE_TABLE}, {weights})', (),
+            output_field=FloatField()
+        )
+    ).extra(
+        tables=[SQLITE_TABLE],
+        where=[
+            f'{SQLITE_TABLE}.rowid = {table}.id',
+            f'{SQLITE_TABLE} MATCH %s'
+        ],
+        params=(match,)
+    ).order_by(*ORDERING)
+
+
+def search_database(queryset, value):
+    matches = Recipe.objects.filter(
+        Q(name__icontains=value)
+        | Q(text__icontains=value)
+        | Q(ingredients__name__icontains=value)
+    ).values('pk')
+    return queryset.filter(pk__in=matches).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    ).order_by(*ORDERING)
+
+
+def search_recipes(queryset, value):
+    if connection.vendor == 'postgresql':
+        return search_postgres(queryset, value)
+    if connection.vendor == 'sqlite':
+        return search_sqlite(queryset, value)
+    return search_database(queryset, value)
+
+
+def update_postgres(cursor, recipe_ids):
+    table = Recipe._meta.db_table
+    names = ingredient_names(
+        f"string_agg({Ingredient._meta.db_table}.name, ' ')"
+    )
+    cursor.execute(
+        f'UPDATE {table} SET search_vector = '
+        "setweight(to_tsvector(%s::regconfig, name), 'A') || "
+        'setweight(to_tsvector(%s::regconfig, '
+        f"COALESCE(({names}), '')), 'B') || "
+        "setweight(to_tsvector(%s::regconfig, text), 'C') "
+        'WHERE id = ANY(%s)',
+        [settings.RECIPE_SEARCH_CONFIG] * 3 + [list(recipe_ids)]
+    )
+
+
+def update_sqlite(cursor, recipe_ids):
+    table = Recipe._meta.db_table
+    names = ingredient_names(
+        f"group_concat({Ingredient._meta.db_table}.name, ' ')"
+    )
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    cursor.execute(
+        f'DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})',
+        recipe_ids
+    )
+    cursor.execute(
+        f'INSERT INTO {SQLITE_TABLE} (rowid, name, ingredients, text) '
+        f"SELECT id, name, COALESCE(({names}), ''), text FROM {table} "
+        f'WHERE id IN ({placeholders})',
+        recipe_ids
+    )
+
+
+@task
+def update_search_index(recipe_ids):
+    if connection.vendor == 'postgresql':
+        update = update_postgres
+    elif connection.vendor == 'sqlite':
+        update = update_sqlite
+    else:
+        return
+    recipe_ids = list(recipe_ids)
+    chunk_size = settings.RECIPE_SEARCH_CHUNK_SIZE
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), chunk_size):
+            update(cursor, recipe_ids[start:start + chunk_size])
+
+
+def dispatch_search_update(recipes):
+    update_search_index.delay(list(recipes))
+
+
+def schedule_search_update(recipe_ids):
+    batch_on_commit(dispatch_search_update, dict.fromkeys(recipe_ids))
+
+
+def rebuild_search_index(chunk_size=None):
+    chunk_size = chunk_size or settings.RECIPE_SEARCH_CHUNK_SIZE
+    total = 0
+    last_pk = 0
+    while True:
+        recipe_ids = list(
+            Recipe.objects.filter(
+                pk__gt=last_pk
+            ).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not recipe_ids:
+            return total
+        update_search_index(recipe_ids)
+        total += len(recipe_ids)
+        last_pk = recipe_ids[-1]
+
+
+def create_search_index(using):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        statements = POSTGRES_INDEXES
+    elif connection.vendor == 'sqlite':
+        statements = SQLITE_TABLES
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
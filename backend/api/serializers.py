@@ -1,6 +1,9 @@
+from collections import Counter
+
 from django.conf import settings
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from recipes.models import (
@@ -14,6 +17,11 @@ from recipes.models import (
 )
 from users.models import CustomUser
 
+from api.images import get_thumbnail_urls, schedule_thumbnails
+from api.pantry import schedule_pantry_update
+from api.recipe_search import schedule_search_update
+from api.shopping_cart import schedule_shopping_list_refresh
+
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
@@ -31,6 +39,8 @@ class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         return (
             user.is_authenticated
@@ -50,30 +60,35 @@ class CustomUserSerializer(UserSerializer):
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'thumbnails',
             'cooking_time'
         )
 
+    def get_thumbnails(self, obj):
+        return get_thumbnail_urls(obj, self.context.get('request'))
+
 
 class UserSubscriptionsSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     def get_recipes(self, obj):
-        recipes_limit = self.context.get(
-            'recipes_limit', settings.DEFAULT_RECIPES_LIMIT
-        )
-        recipes = obj.recipes.all()[:recipes_limit]
+        if hasattr(obj, 'recipes_preview'):
+            recipes = obj.recipes_preview
+        else:
+            recipes_limit = self.context.get(
+                'recipes_limit', settings.DEFAULT_RECIPES_LIMIT
+            )
+            recipes = obj.recipes.all()[:recipes_limit]
         return RecipeMinifiedSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     class Meta:
         model = CustomUser
         fields = (
@@ -145,9 +160,13 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 class RecipeListSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = CustomUserSerializer()
-    ingredients = serializers.SerializerMethodField()
+    ingredients = RecipeIngredientSerializer(
+        source='recipeingredient_set',
+        many=True
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -160,30 +179,41 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time'
         )
 
-    def get_ingredients(self, obj):
-        return RecipeIngredientSerializer(
-            RecipeIngredient.objects.filter(recipe=obj).all(), many=True
-        ).data
+    def get_thumbnails(self, obj):
+        return get_thumbnail_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
-            obj.favorites.filter(user=request.user).exists()
-            and request.user.is_authenticated
+            request.user.is_authenticated
+            and obj.favorites.filter(user=request.user).exists()
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
-            obj.shoppingcarts.filter(user=request.user).exists()
-            and request.user.is_authenticated
+            request.user.is_authenticated
+            and obj.shoppingcarts.filter(user=request.user).exists()
         )
 
 
+class LazyBase64ImageField(Base64FieldMixin, serializers.FileField):
+    ALLOWED_TYPES = Base64ImageField.ALLOWED_TYPES
+    INVALID_FILE_MESSAGE = Base64ImageField.INVALID_FILE_MESSAGE
+    INVALID_TYPE_MESSAGE = Base64ImageField.INVALID_TYPE_MESSAGE
+
+    get_file_extension = Base64ImageField.get_file_extension
+
+
 class TagCreateInRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -191,9 +221,7 @@ class TagCreateInRecipeSerializer(serializers.ModelSerializer):
 
 
 class IngredientCreateInRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(
         write_only=True
     )
@@ -217,11 +245,10 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     ingredients = IngredientCreateInRecipeSerializer(
         many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
+    tags = serializers.ListField(
+        child=serializers.IntegerField()
     )
-    image = Base64ImageField()
+    image = LazyBase64ImageField()
     author = CustomUserSerializer(required=False)
 
     class Meta:
@@ -237,20 +264,43 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def resolve(self, model, ids, duplicate_message, missing_message):
+        errors = []
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1
+        )
+        if duplicates:
+            errors.append(
+                f'{duplicate_message} Повторяются: '
+                f'{", ".join(map(str, duplicates))}.'
+            )
+        prefetched = self.context.get('prefetched', {}).get(model)
+        if prefetched is None:
+            objects = model.objects.in_bulk(set(ids))
+        else:
+            objects = {pk: prefetched[pk] for pk in ids if pk in prefetched}
+        missing = sorted(set(ids) - objects.keys())
+        if missing:
+            errors.append(
+                f'{missing_message}: {", ".join(map(str, missing))}.'
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        return objects
+
     def validate_ingredients(self, value):
         if len(value) < 1:
             raise serializers.ValidationError(
                 'Должно быть не менее одного ингредиента.'
             )
-
-        ingredients = self.context.get('request').data['ingredients']
-        id_items = []
-        for ingredient in ingredients:
-            if ingredient['id'] in id_items:
-                raise serializers.ValidationError(
-                    'Ингредиенты в рецепте не должны повторяться.'
-                )
-            id_items.append(ingredient['id'])
+        ingredients = self.resolve(
+            Ingredient,
+            [item['id'] for item in value],
+            'Ингредиенты в рецепте не должны повторяться.',
+            'Ингредиенты не найдены'
+        )
+        for item in value:
+            item['id'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
@@ -258,16 +308,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Должно быть не менее одного тэга.'
             )
-
-        tags = self.context.get('request').data['tags']
-        tag_items = []
-        for tag in tags:
-            if tag in tag_items:
-                raise serializers.ValidationError(
-                    'Тэги в рецепте не должны повторяться.'
-                )
-            tag_items.append(tag)
-        return value
+        tags = self.resolve(
+            Tag,
+            value,
+            'Тэги в рецепте не должны повторяться.',
+            'Тэги не найдены'
+        )
+        return [tags[pk] for pk in value]
 
     def validate_cooking_time(self, value):
         if value < 1:
@@ -291,23 +338,119 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         request = self.context.get('request')
-        recipe = Recipe.objects.create(author=request.user, **validated_data)
+        recipe = Recipe.objects.create(
+            author=request.user,
+            ingredients_count=len(ingredients),
+            **validated_data
+        )
         recipe.tags.set(tags)
         self.bulk_create(ingredients, recipe)
+        schedule_pantry_update(recipe.pk)
+        schedule_search_update([recipe.pk])
+        schedule_thumbnails(recipe)
         return recipe
 
-    def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+    @staticmethod
+    def update_fields(instance, validated_data):
+        changed = []
+        for field, value in validated_data.items():
+            if getattr(instance, field) != value:
+                setattr(instance, field, value)
+                changed.append(field)
+        return changed
+
+    @staticmethod
+    def update_tags(instance, tags):
+        if {tag.pk for tag in instance.tags.all()} == {tag.pk for tag in tags}:
+            return False
         instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance.pk).delete()
-        self.bulk_create(ingredients, instance)
-        return super().update(instance, validated_data)
+        return True
+
+    @staticmethod
+    def update_ingredients(instance, ingredients):
+        current = {
+            item.ingredient_id: item
+            for item in instance.recipeingredient_set.all()
+        }
+        amounts = {
+            ingredient['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = [
+            item for ingredient_id, item in current.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id, item.amount)
+            if item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        added = [
+            RecipeIngredient(
+                recipe=instance,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if removed:
+            RecipeIngredient.objects.filter(
+                pk__in=[item.pk for item in removed]
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+            schedule_pantry_update(
+                instance.pk, [item.ingredient_id for item in added]
+            )
+        if removed or changed or added:
+            schedule_shopping_list_refresh(instance.pk, [
+                item.ingredient_id for item in removed + changed + added
+            ])
+        instance.ingredients_count = len(amounts)
+        return bool(removed or changed or added)
+
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if 'image' in validated_data:
+            validated_data['thumbnails_ready'] = False
+        with transaction.atomic():
+            changed = self.update_fields(instance, validated_data)
+            if tags is not None:
+                self.update_tags(instance, tags)
+            if ingredients is not None and self.update_ingredients(
+                instance, ingredients
+            ):
+                changed.append('ingredients_count')
+            if changed:
+                instance.save(update_fields=changed)
+        if 'image' in validated_data:
+            schedule_thumbnails(instance)
+        return instance
 
     def to_representation(self, instance):
         return RecipeListSerializer(instance, context=self.context).data
 
 
+class RecipeImportSerializer(RecipeCreateUpdateSerializer):
+    image = LazyBase64ImageField(required=False)
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'tags',
+            'ingredients',
+            'name',
+            'image',
+            'text',
+            'cooking_time'
+        )
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -323,10 +466,16 @@ class FavoriteSerializer(serializers.ModelSerializer):
 class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
-        fields = ('user', 'recipe')
+        fields = ('user', 'recipe', 'servings')
         validators = [
             UniqueTogetherValidator(
                 queryset=ShoppingCart.objects.all(),
                 fields=('user', 'recipe')
             )
         ]
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    name = serializers.ReadOnlyField()
+    measurement_unit = serializers.ReadOnlyField()
+    total_amount = serializers.ReadOnlyField(source='total')
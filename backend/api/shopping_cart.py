@@ -0,0 +1,167 @@
+import csv
+import io
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BigIntegerField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Sum
+)
+from django.db.models.functions import Cast
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from users.models import CustomUser
+
+from api.tasks import batch_on_commit, task
+from api.units import base_unit, unit_factor
+
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+PDF_FONT = 'ShoppingCartFont'
+
+
+def shopping_list(user):
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=base_unit('ingredient__measurement_unit')
+    ).annotate(
+        total=Cast(Sum('total_amount'), BigIntegerField())
+    ).order_by('name', 'measurement_unit')
+
+
+def shopping_cart_items(user):
+    return shopping_list(user).values_list(
+        'name', 'measurement_unit', 'total'
+    )
+
+
+def shopping_cart_totals(user_ids, ingredient_ids=None):
+    totals = RecipeIngredient.objects.filter(
+        recipe__shoppingcarts__user__in=user_ids
+    )
+    if ingredient_ids is not None:
+        totals = totals.filter(ingredient__in=ingredient_ids)
+    return totals.values_list(
+        'recipe__shoppingcarts__user', 'ingredient'
+    ).annotate(
+        total=Sum(ExpressionWrapper(
+            unit_factor('ingredient__measurement_unit')
+            * F('amount')
+            * F('recipe__shoppingcarts__servings'),
+            output_field=IntegerField()
+        ))
+    ).order_by()
+
+
+def refresh_shopping_lists(user_ids, ingredient_ids=None):
+    user_ids = list(user_ids)
+    if ingredient_ids is not None:
+        ingredient_ids = list(ingredient_ids)
+        if not ingredient_ids:
+            return
+    chunk_size = settings.SHOPPING_LIST_CHUNK_SIZE
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        with transaction.atomic():
+            list(CustomUser.objects.select_for_update().filter(
+                pk__in=chunk
+            ).order_by('pk').values_list('pk', flat=True))
+            items = ShoppingListItem.objects.filter(user__in=chunk)
+            if ingredient_ids is not None:
+                items = items.filter(ingredient__in=ingredient_ids)
+            totals = list(shopping_cart_totals(chunk, ingredient_ids))
+            items.delete()
+            ShoppingListItem.objects.bulk_create([
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total
+                )
+                for user_id, ingredient_id, total in totals
+            ])
+
+
+@task
+def refresh_recipe_shopping_lists(recipe_id, ingredient_ids=None):
+    refresh_shopping_lists(
+        ShoppingCart.objects.filter(
+            recipe=recipe_id
+        ).values_list('user_id', flat=True),
+        ingredient_ids
+    )
+
+
+def dispatch_shopping_list_refresh(recipes):
+    for recipe_id, ingredient_ids in recipes.items():
+        refresh_recipe_shopping_lists.delay(recipe_id, ingredient_ids)
+
+
+def schedule_shopping_list_refresh(recipe_id, ingredient_ids=None):
+    batch_on_commit(
+        dispatch_shopping_list_refresh, {recipe_id: ingredient_ids}
+    )
+
+
+def chunked(lines):
+    lines = iter(lines)
+    chunk = ''.join(islice(lines, settings.SHOPPING_CART_CHUNK_SIZE))
+    while chunk:
+        yield chunk
+        chunk = ''.join(islice(lines, settings.SHOPPING_CART_CHUNK_SIZE))
+
+
+def export_txt(items):
+    return chunked(
+        f'{name} ({measurement_unit}) - {total}\n'
+        for name, measurement_unit, total in items
+    )
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(items):
+    writer = csv.writer(Echo())
+    return chunked(
+        writer.writerow(row) for row in chain([CSV_HEADER], items)
+    )
+
+
+def export_pdf(items):
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_CART_PDF_FONT)
+        )
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 50
+    line_height = 20
+    y = height - margin
+    for name, measurement_unit, total in items:
+        if y < margin:
+            page.showPage()
+            y = height - margin
+        page.setFont(PDF_FONT, 12)
+        page.drawString(margin, y, f'{name} ({measurement_unit}) - {total}')
+        y -= line_height
+    page.save()
+    buffer.seek(0)
+    return iter(lambda: buffer.read(settings.SHOPPING_CART_PDF_CHUNK), b'')
+
+
+EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'pdf': export_pdf,
+}
@@ -0,0 +1,224 @@
+from django.core.signals import request_started
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete
+)
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag
+)
+from users.models import CustomUser
+
+from api.authentication import invalidate_tokens
+from api.cache import bump_version
+from api.db import check_connections
+from api.feed import invalidate_fragments, invalidate_overlay
+from api.ingredient_search import create_postgres_indexes, reset_index
+from api.pantry import schedule_pantry_update
+from api.recipe_search import create_search_index, schedule_search_update
+from api.shopping_cart import (
+    refresh_shopping_lists,
+    schedule_shopping_list_refresh
+)
+
+
+def recipe_ingredient_ids(recipe_id):
+    return list(RecipeIngredient.objects.filter(
+        recipe=recipe_id
+    ).values_list('ingredient_id', flat=True))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_shopping_list_items(sender, instance, **kwargs):
+    refresh_shopping_lists(
+        [instance.user_id], recipe_ingredient_ids(instance.recipe_id)
+    )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def collect_shopping_list_items(sender, instance, **kwargs):
+    instance.ingredient_ids = recipe_ingredient_ids(instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_shopping_list_items(sender, instance, **kwargs):
+    refresh_shopping_lists(
+        [instance.user_id], getattr(instance, 'ingredient_ids', None)
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_list_items(sender, instance, created, **kwargs):
+    schedule_shopping_list_refresh(
+        instance.recipe_id, [instance.ingredient_id] if created else None
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def delete_shopping_list_items(sender, instance, **kwargs):
+    schedule_shopping_list_refresh(
+        instance.recipe_id, [instance.ingredient_id]
+    )
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def update_pantry_index(sender, instance, **kwargs):
+    schedule_pantry_update(instance.recipe_id, [instance.ingredient_id])
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def reset_ingredient_index(sender, **kwargs):
+    reset_index()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_response_cache_version(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver(post_migrate)
+def create_ingredient_search_indexes(sender, using, **kwargs):
+    if sender.name == 'recipes':
+        create_postgres_indexes(using)
+        create_search_index(using)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe_fragment(sender, instance, **kwargs):
+    invalidate_fragments([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipe_ingredient_fragment(sender, instance, **kwargs):
+    invalidate_fragments([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_fragment(sender, instance, reverse, **kwargs):
+    if reverse:
+        bump_version(Tag)
+    else:
+        invalidate_fragments([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_fragments(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_fragments(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_user_overlay(sender, instance, **kwargs):
+    invalidate_overlay(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search(sender, instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_recipe_ingredient_search(sender, instance, created, **kwargs):
+    if created:
+        schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def delete_recipe_ingredient_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            instance.recipeingredient_set.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def update_ingredient_recipes_count(sender, instance, **kwargs):
+    recipe_ids = list(
+        instance.recipeingredient_set.values_list('recipe_id', flat=True)
+    )
+    transaction.on_commit(
+        lambda: Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).update_ingredients_count()
+    )
+
+
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipe_id', 'in_carts_count'),
+    Recipe: (CustomUser, 'author_id', 'recipes_count'),
+    Subscription: (CustomUser, 'author_id', 'subscribers_count'),
+}
+
+
+def update_counter(sender, instance, delta):
+    model, attribute, field = COUNTERS[sender]
+    queryset = model.objects.filter(pk=getattr(instance, attribute))
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        update_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(sender, instance, **kwargs):
+    update_counter(sender, instance, -1)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    check_connections()
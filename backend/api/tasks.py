@@ -0,0 +1,402 @@
+import json
+import logging
+import signal
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.models import Task
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH = 10
+REDIS_PREFIX = 'foodgram:tasks:'
+KILL_GRACE = 30
+STALE_GRACE = 60
+TIMEOUT_ERROR = 'Задача не завершилась за отведенное время.'
+
+TaskMessage = namedtuple('TaskMessage', ('id', 'name', 'args', 'attempts'))
+
+tasks = {}
+
+_batches = threading.local()
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def task(func):
+    name = f'{func.__module__}.{func.__name__}'
+    tasks[name] = func
+    func.delay = lambda *args: enqueue(name, args)
+    return func
+
+
+def enqueue(name, args):
+    args = list(args)
+    transaction.on_commit(lambda: get_backend().push(name, args))
+
+
+def merge_batch(batch, items):
+    for key, values in items.items():
+        if values is None:
+            batch[key] = None
+        elif key not in batch:
+            batch[key] = set(values)
+        elif batch[key] is not None:
+            batch[key].update(values)
+
+
+def batch_on_commit(dispatch, items):
+    if not hasattr(_batches, 'pending'):
+        _batches.pending = {}
+    pending = _batches.pending
+    callbacks = [
+        callback
+        for _, callback in transaction.get_connection().run_on_commit
+    ]
+    if dispatch in pending and pending[dispatch][0] in callbacks:
+        merge_batch(pending[dispatch][1], items)
+        return
+    batch = {}
+
+    def run():
+        if pending.get(dispatch, (None,))[0] is run:
+            del pending[dispatch]
+        dispatch({
+            key: None if values is None else sorted(values)
+            for key, values in batch.items()
+        })
+
+    pending[dispatch] = (run, batch)
+    merge_batch(batch, items)
+    transaction.on_commit(run)
+
+
+def get_task(name):
+    if name not in tasks:
+        import_string(name)
+    if name not in tasks:
+        raise ImproperlyConfigured(f'{name} не является фоновой задачей.')
+    return tasks[name]
+
+
+def retry_delay(attempts):
+    return min(
+        settings.TASK_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.TASK_RETRY_MAX_DELAY
+    )
+
+
+def raise_timeout(signum, frame):
+    raise TaskTimeout(TIMEOUT_ERROR)
+
+
+def run_with_timeout(func, args, timeout):
+    if not timeout:
+        return func(*args)
+    handler = signal.signal(signal.SIGALRM, raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, handler)
+
+
+def stale_before():
+    return settings.TASK_TIMEOUT + KILL_GRACE + STALE_GRACE
+
+
+def execute(backend, message, timeout=None):
+    start = time.perf_counter()
+    try:
+        run_with_timeout(get_task(message.name), message.args, timeout)
+    except Exception as error:
+        duration = time.perf_counter() - start
+        attempts = message.attempts + 1
+        if attempts < settings.TASK_MAX_ATTEMPTS:
+            logger.warning(
+                'Задача %s завершилась ошибкой, попытка %s.',
+                message.name, attempts, exc_info=True
+            )
+            backend.retry(
+                message, repr(error), retry_delay(attempts), duration
+            )
+        else:
+            logger.exception('Задача %s не выполнена.', message.name)
+            backend.fail(message, repr(error), duration)
+        return False
+    backend.complete(message, time.perf_counter() - start)
+    return True
+
+
+class SyncBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: [0, 0.0])
+
+    def push(self, name, args):
+        execute(self, TaskMessage(None, name, args, 0))
+
+    def observe(self, message, status, duration):
+        with self.lock:
+            counter = self.counters[message.name, status]
+            counter[0] += 1
+            counter[1] += duration
+
+    def complete(self, message, duration):
+        self.observe(message, Task.DONE, duration)
+
+    def retry(self, message, error, delay, duration):
+        self.observe(message, Task.FAILED, duration)
+
+    def fail(self, message, error, duration):
+        self.observe(message, Task.FAILED, duration)
+
+    def stats(self):
+        with self.lock:
+            return [
+                (name, status, count, duration)
+                for (name, status), (count, duration)
+                in sorted(self.counters.items())
+            ]
+
+
+class DatabaseBackend:
+    def push(self, name, args):
+        Task.objects.create(name=name, args=json.dumps(args))
+
+    def pop(self):
+        now = timezone.now()
+        candidates = Task.objects.filter(
+            status=Task.PENDING, run_at__lte=now
+        ).order_by('run_at').values_list('pk', flat=True)[:CLAIM_BATCH]
+        for pk in candidates:
+            claimed = Task.objects.filter(
+                pk=pk, status=Task.PENDING
+            ).update(status=Task.RUNNING, started_at=now)
+            if claimed:
+                task = Task.objects.get(pk=pk)
+                return TaskMessage(
+                    task.pk, task.name, json.loads(task.args), task.attempts
+                )
+        return None
+
+    def complete(self, message, duration):
+        Task.objects.filter(pk=message.id).update(
+            status=Task.DONE,
+            finished_at=timezone.now(),
+            duration=duration
+        )
+
+    def retry(self, message, error, delay, duration):
+        Task.objects.filter(pk=message.id).update(
+            status=Task.PENDING,
+            attempts=F('attempts') + 1,
+            run_at=timezone.now() + timedelta(seconds=delay),
+            duration=duration,
+            error=error
+        )
+
+    def fail(self, message, error, duration):
+        Task.objects.filter(pk=message.id).update(
+            status=Task.FAILED,
+            attempts=F('attempts') + 1,
+            finished_at=timezone.now(),
+            duration=duration,
+            error=error
+        )
+
+    def requeue_stale(self):
+        now = timezone.now()
+        stale = Task.objects.filter(
+            status=Task.RUNNING,
+            started_at__lt=now - timedelta(seconds=stale_before())
+        )
+        stale.filter(
+            attempts__gte=settings.TASK_MAX_ATTEMPTS - 1
+        ).update(
+            status=Task.FAILED,
+            attempts=F('attempts') + 1,
+            finished_at=now,
+            error=TIMEOUT_ERROR
+        )
+        return stale.update(
+            status=Task.PENDING,
+            attempts=F('attempts') + 1,
+            run_at=now
+        )
+
+    def purge(self):
+        Task.objects.filter(
+            status=Task.DONE,
+            finished_at__lt=timezone.now() - timedelta(
+                seconds=settings.TASK_RESULT_TIMEOUT
+            )
+        ).delete()
+
+    def stats(self):
+        return list(
+            Task.objects.values_list('name', 'status').annotate(
+                count=Count('pk'), total=Sum('duration')
+            ).order_by('name', 'status')
+        )
+
+
+class RedisBackend:
+    def __init__(self):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                'Для RedisBackend установите пакет redis.'
+            )
+        self.client = redis.Redis.from_url(settings.TASK_QUEUE_REDIS_URL)
+
+    def key(self, name):
+        return f'{REDIS_PREFIX}{name}'
+
+    def push(self, name, args):
+        task_id = self.client.incr(self.key('id'))
+        self.client.hset(self.key('data'), task_id, json.dumps({
+            'name': name, 'args': args, 'attempts': 0
+        }))
+        self.client.zadd(self.key('scheduled'), {task_id: time.time()})
+
+    def pop(self):
+        now = time.time()
+        candidates = self.client.zrangebyscore(
+            self.key('scheduled'), '-inf', now, start=0, num=CLAIM_BATCH
+        )
+        for task_id in candidates:
+            if not self.client.zrem(self.key('scheduled'), task_id):
+                continue
+            self.client.zadd(self.key('running'), {task_id: now})
+            data = self.client.hget(self.key('data'), task_id)
+            if data is None:
+                self.client.zrem(self.key('running'), task_id)
+                continue
+            data = json.loads(data)
+            return TaskMessage(
+                task_id, data['name'], data['args'], data['attempts']
+            )
+        return None
+
+    def observe(self, message, status, duration):
+        field = f'{message.name}:{status}'
+        pipeline = self.client.pipeline()
+        pipeline.hincrby(self.key('count'), field, 1)
+        pipeline.hincrbyfloat(self.key('duration'), field, duration)
+        pipeline.execute()
+
+    def complete(self, message, duration):
+        pipeline = self.client.pipeline()
+        pipeline.zrem(self.key('running'), message.id)
+        pipeline.hdel(self.key('data'), message.id)
+        pipeline.execute()
+        self.observe(message, Task.DONE, duration)
+
+    def retry(self, message, error, delay, duration):
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.key('data'), message.id, json.dumps({
+            'name': message.name,
+            'args': message.args,
+            'attempts': message.attempts + 1,
+            'error': error,
+        }))
+        pipeline.zrem(self.key('running'), message.id)
+        pipeline.zadd(
+            self.key('scheduled'), {message.id: time.time() + delay}
+        )
+        pipeline.execute()
+        self.observe(message, 'retried', duration)
+
+    def fail(self, message, error, duration):
+        pipeline = self.client.pipeline()
+        pipeline.zrem(self.key('running'), message.id)
+        pipeline.hdel(self.key('data'), message.id)
+        pipeline.hset(self.key('failed'), message.id, json.dumps({
+            'name': message.name, 'args': message.args, 'error': error
+        }))
+        pipeline.execute()
+        self.observe(message, Task.FAILED, duration)
+
+    def requeue_stale(self):
+        now = time.time()
+        stale = self.client.zrangebyscore(
+            self.key('running'), '-inf', now - stale_before()
+        )
+        requeued = 0
+        for task_id in stale:
+            data = self.client.hget(self.key('data'), task_id)
+            if data is None or not self.client.zrem(
+                self.key('running'), task_id
+            ):
+                continue
+            data = json.loads(data)
+            message = TaskMessage(
+                task_id, data['name'], data['args'], data['attempts']
+            )
+            if message.attempts + 1 >= settings.TASK_MAX_ATTEMPTS:
+                self.fail(message, TIMEOUT_ERROR, 0.0)
+                continue
+            self.retry(message, TIMEOUT_ERROR, 0, 0.0)
+            requeued += 1
+        return requeued
+
+    def purge(self):
+        pass
+
+    def stats(self):
+        counts = self.client.hgetall(self.key('count'))
+        durations = self.client.hgetall(self.key('duration'))
+        stats = [
+            (*field.decode().rsplit(':', 1), int(count),
+             float(durations.get(field, 0)))
+            for field, count in sorted(counts.items())
+        ]
+        stats.append((
+            '', Task.PENDING, self.client.zcard(self.key('scheduled')), 0.0
+        ))
+        stats.append((
+            '', Task.RUNNING, self.client.zcard(self.key('running')), 0.0
+        ))
+        return stats
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.TASK_QUEUE_BACKEND)()
+        return _backend
+
+
+def render_metrics():
+    stats = get_backend().stats()
+    lines = ['# TYPE foodgram_tasks gauge']
+    lines += [
+        f'foodgram_tasks{{task="{name}",status="{status}"}} {count}'
+        for name, status, count, _ in stats
+    ]
+    lines.append('# TYPE foodgram_task_duration_seconds_total counter')
+    lines += [
+        'foodgram_task_duration_seconds_total'
+        f'{{task="{name}",status="{status}"}} {duration or 0.0}'
+        for name, status, _, duration in stats
+    ]
+    return '\n'.join(lines) + '\n'
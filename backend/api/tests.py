@@ -0,0 +1,696 @@
+import base64
+import random
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    OperationalError,
+    connection,
+    connections
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag
+)
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APITransactionTestCase
+from users.models import CustomUser
+
+from api import db, pantry
+from api.authentication import local_cache
+from api.models import Task
+from api.pagination import KeysetPagination
+from api.pantry import ORDERING as PANTRY_ORDERING
+from api.pantry import rank_pantry, reset_index
+from api.recipe_search import rebuild_search_index, search_recipes
+from api.serializers import RecipeCreateUpdateSerializer
+from api.tasks import (
+    TIMEOUT_ERROR,
+    DatabaseBackend,
+    execute,
+    stale_before,
+    task
+)
+
+RECIPES_COUNT = 100
+INGREDIENTS_COUNT = 5
+
+
+@task
+def sleep_task(seconds):
+    time.sleep(seconds)
+
+
+class RecipeListQueriesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create(
+            email='author@foodgram.ru',
+            username='author',
+            first_name='Автор',
+            last_name='Рецептов'
+        )
+        cls.user = CustomUser.objects.create(
+            email='user@foodgram.ru',
+            username='user',
+            first_name='Читатель',
+            last_name='Рецептов'
+        )
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        tags = [
+            Tag.objects.create(
+                name='Завтрак', color='#E26C2D', slug='breakfast'
+            ),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(INGREDIENTS_COUNT)
+        ]
+        for number in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            ])
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def count_queries(self, page_size):
+        cache.clear()
+        with mock.patch.object(KeysetPagination, 'page_size', page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(queries)
+
+    def test_anonymous_list_queries_do_not_depend_on_page_size(self):
+        self.assertEqual(self.count_queries(6), self.count_queries(100))
+
+    def test_authenticated_list_queries_do_not_depend_on_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.count_queries(6), self.count_queries(100))
+
+
+class QueryPlansTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            CustomUser.objects.create(
+                email=f'user{number}@foodgram.ru',
+                username=f'user{number}',
+                first_name='Пользователь',
+                last_name=str(number)
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(INGREDIENTS_COUNT)
+        ]
+        for user in users:
+            for author in users:
+                if author != user:
+                    Subscription.objects.create(user=user, author=author)
+            for number in range(3):
+                recipe = Recipe.objects.create(
+                    author=user,
+                    name=f'Рецепт {number}',
+                    text='Описание',
+                    cooking_time=10
+                )
+                for ingredient in ingredients:
+                    RecipeIngredient.objects.create(
+                        recipe=recipe, ingredient=ingredient, amount=1
+                    )
+                for reader in users:
+                    Favorite.objects.create(user=reader, recipe=recipe)
+                    ShoppingCart.objects.create(user=reader, recipe=recipe)
+
+    def test_hot_queries_use_indexes(self):
+        output = StringIO()
+        try:
+            call_command('check_query_plans', stdout=output)
+        except CommandError as error:
+            self.fail(f'{error}\n{output.getvalue()}')
+
+
+class CursorWalkMixin:
+
+    def walk(self, url, data=None):
+        ids = []
+        with mock.patch.object(KeysetPagination, 'page_size', 2):
+            while url:
+                response = self.client.get(url, data)
+                self.assertEqual(response.status_code, 200)
+                ids += [item['id'] for item in response.data['results']]
+                url, data = response.data['next'], None
+        return ids
+
+
+class KeysetPaginationTest(CursorWalkMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(
+            email='walker@foodgram.ru',
+            username='walker',
+            first_name='Читатель',
+            last_name='Ленты'
+        )
+        for number in range(7):
+            author = CustomUser.objects.create(
+                email=f'writer{number}@foodgram.ru',
+                username=f'writer{number % 3}{number}',
+                first_name='Автор',
+                last_name='Ленты'
+            )
+            Subscription.objects.create(user=cls.user, author=author)
+            for index in range(2):
+                Recipe.objects.create(
+                    author=author,
+                    name=f'Блюдо {number}-{index}',
+                    text='Описание',
+                    cooking_time=10
+                )
+        recipes = list(Recipe.objects.order_by('pk'))
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in recipes[::3]
+        ]).update(pub_date=recipes[0].pub_date)
+        for index, recipe in enumerate(recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=index % 4
+            )
+
+    def recipes(self, *fields):
+        return sorted(
+            Recipe.objects.values_list(*fields, 'pk'), reverse=True
+        )
+
+    def test_default_walk(self):
+        self.assertEqual(
+            self.walk('/api/recipes/?cursor='),
+            [row[-1] for row in self.recipes('pub_date')]
+        )
+
+    def test_popular_walk(self):
+        self.assertEqual(
+            self.walk('/api/recipes/?ordering=popular&cursor='),
+            [row[-1] for row in self.recipes('favorites_count', 'pub_date')]
+        )
+
+    def test_subscriptions_walk(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(
+            self.walk('/api/users/subscriptions/?cursor='),
+            [pk for _, pk in sorted(
+                CustomUser.objects.filter(
+                    subscribed_by__user=self.user
+                ).values_list('username', 'pk')
+            )]
+        )
+
+    def test_malformed_cursor(self):
+        for cursor in (
+            '!!!',
+            base64.urlsafe_b64encode(b'{').decode(),
+            base64.urlsafe_b64encode(b'[1]').decode(),
+            base64.urlsafe_b64encode(b'["date", 1]').decode(),
+            base64.urlsafe_b64encode(b'[null, 1]').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_count_modes(self):
+        for params, count in (
+            ({}, None),
+            ({'count': 'none'}, None),
+            ({'count': 'exact'}, Recipe.objects.count()),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': '', **params}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['count'], count)
+
+
+class PantryCursorTest(CursorWalkMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create(
+            email='cook@foodgram.ru',
+            username='cook',
+            first_name='Повар',
+            last_name='Рецептов'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Продукт {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.coverage = {}
+        for number in range(11):
+            used = cls.ingredients[:1] if number % 4 == 0 else cls.ingredients
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Блюдо {number}',
+                text='Описание',
+                cooking_time=10,
+                ingredients_count=len(used)
+            )
+            for ingredient in used:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+            cls.coverage[recipe.pk] = (1 / len(used), len(used) - 1)
+
+    def setUp(self):
+        reset_index()
+
+    def expected(self):
+        return sorted(
+            self.coverage,
+            key=lambda pk: (-self.coverage[pk][0], self.coverage[pk][1], -pk)
+        )
+
+    def test_cursor_keeps_tied_coverage(self):
+        url = (
+            f'/api/recipes/pantry/?ingredients={self.ingredients[0].pk}'
+            '&cursor='
+        )
+        self.assertEqual(self.walk(url), self.expected())
+        with override_settings(PANTRY_SEARCH_BACKEND='database'):
+            self.assertEqual(self.walk(url), self.expected())
+
+
+class RecipeUpdateTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create(
+            email='baker@foodgram.ru',
+            username='baker',
+            first_name='Пекарь',
+            last_name='Рецептов'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author,
+            name='Хлеб',
+            text='Описание',
+            cooking_time=10
+        )
+
+    def setUp(self):
+        self.stale = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            favorites_count=5, in_carts_count=3, thumbnails_ready=True
+        )
+
+    def assertCountersKept(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.name, 'Батон')
+        self.assertEqual(recipe.favorites_count, 5)
+        self.assertEqual(recipe.in_carts_count, 3)
+        self.assertTrue(recipe.thumbnails_ready)
+
+    def test_serializer_update_keeps_counters(self):
+        serializer = RecipeCreateUpdateSerializer(
+            self.stale, data={'name': 'Батон'}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertCountersKept()
+
+    def test_full_save_keeps_counters(self):
+        self.stale.name = 'Батон'
+        self.stale.save()
+        self.assertCountersKept()
+
+
+class TokenCacheTest(APITestCase):
+
+    def setUp(self):
+        local_cache.clear()
+        user = CustomUser.objects.create(
+            email='guest@foodgram.ru',
+            username='guest',
+            first_name='Гость',
+            last_name='Рецептов'
+        )
+        self.token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        local_cache.clear()
+
+    def test_local_cache_expires_revoked_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with mock.patch('api.signals.invalidate_tokens'):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        expired = time.monotonic() + settings.TOKEN_LOCAL_CACHE_TIMEOUT + 1
+        with mock.patch(
+            'api.authentication.time.monotonic', return_value=expired
+        ):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ShoppingListTotalTest(APITestCase):
+
+    def test_total_exceeds_integer_range(self):
+        user = CustomUser.objects.create(
+            email='buyer@foodgram.ru',
+            username='buyer',
+            first_name='Покупатель',
+            last_name='Рецептов'
+        )
+        flour = Ingredient.objects.create(name='Мука', measurement_unit='кг')
+        self.client.force_authenticate(user)
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=user,
+                name=f'Пирог {number}',
+                text='Описание',
+                cooking_time=10
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=flour, amount=32767
+            )
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/',
+                {'servings': 50},
+                format='json'
+            )
+            self.assertEqual(response.status_code, 201)
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data[0]['total_amount'], 2 * 32767 * 1000 * 50
+        )
+
+
+class TaskQueueTest(TestCase):
+
+    def test_requeue_stale_respects_max_attempts(self):
+        started_at = timezone.now() - timedelta(seconds=stale_before() + 1)
+        retried, exhausted, running = [
+            Task.objects.create(
+                name='api.tests.sleep_task',
+                status=Task.RUNNING,
+                attempts=attempts,
+                started_at=started_at
+            )
+            for attempts in (0, settings.TASK_MAX_ATTEMPTS - 1, 0)
+        ]
+        Task.objects.filter(pk=running.pk).update(started_at=timezone.now())
+        self.assertEqual(DatabaseBackend().requeue_stale(), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), (Task.PENDING, 1))
+        self.assertEqual(
+            (exhausted.status, exhausted.attempts, exhausted.error),
+            (Task.FAILED, settings.TASK_MAX_ATTEMPTS, TIMEOUT_ERROR)
+        )
+        self.assertEqual(running.status, Task.RUNNING)
+
+    def test_execute_stops_task_after_timeout(self):
+        backend = DatabaseBackend()
+        backend.push('api.tests.sleep_task', [5])
+        message = backend.pop()
+        with self.assertLogs('api.tasks', 'WARNING'):
+            self.assertFalse(execute(backend, message, 0.1))
+        queued = Task.objects.get(pk=message.id)
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertIn(TIMEOUT_ERROR, queued.error)
+
+
+class RecipeSearchCursorTest(CursorWalkMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create(
+            email='chef@foodgram.ru',
+            username='chef',
+            first_name='Шеф',
+            last_name='Рецептов'
+        )
+        for number in range(9):
+            Recipe.objects.create(
+                author=author,
+                name='Суп суп' if number % 3 == 0 else 'Суп',
+                text='Описание',
+                cooking_time=10
+            )
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+        rebuild_search_index()
+
+    def test_cursor_keeps_tied_rank(self):
+        ids = self.walk('/api/recipes/', {'search': 'суп', 'cursor': ''})
+        self.assertEqual(ids, list(search_recipes(
+            Recipe.objects.all(), 'суп'
+        ).values_list('pk', flat=True)))
+        self.assertEqual(len(ids), 9)
+
+
+class PantryIndexTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        author = CustomUser.objects.create(
+            email='pantry@foodgram.ru',
+            username='pantry',
+            first_name='Повар',
+            last_name='Продуктов'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Запас {number}', measurement_unit='г'
+            )
+            for number in range(12)
+        ]
+        for number in range(60):
+            used = rng.sample(cls.ingredients, rng.randint(1, 6))
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                ingredients_count=len(used)
+            )
+            for ingredient in used:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+        cls.pantries = [
+            [ingredient.pk for ingredient in rng.sample(cls.ingredients, size)]
+            for size in (1, 2, 3, 5, 8, 12)
+        ]
+
+    def setUp(self):
+        reset_index()
+
+    def assertMatchesDatabase(self, ingredient_ids):
+        self.assertEqual(
+            [tuple(row) for row in rank_pantry(ingredient_ids)],
+            list(Recipe.objects.by_pantry(ingredient_ids).order_by(
+                *PANTRY_ORDERING
+            ).values_list('pk', 'coverage', 'missing'))
+        )
+
+    def test_ranking_matches_database(self):
+        for density in (1, 256):
+            with override_settings(PANTRY_INDEX_DENSITY=density):
+                reset_index()
+                for ingredient_ids in self.pantries:
+                    self.assertMatchesDatabase(ingredient_ids)
+
+    def test_ranking_pages(self):
+        ranking = rank_pantry(self.pantries[3])
+        rows = list(ranking)
+        self.assertEqual(ranking.count(), len(rows))
+        self.assertEqual(ranking[7:19], rows[7:19])
+        row = rows[9]
+        self.assertEqual(
+            list(ranking.after([row.coverage, row.missing, row.pk])),
+            rows[10:]
+        )
+
+    def test_index_applies_logged_changes(self):
+        rank_pantry(self.pantries[0])
+        index = pantry._index
+        removed = RecipeIngredient.objects.order_by('pk').first()
+        removed.delete()
+        added = RecipeIngredient.objects.create(
+            recipe=Recipe.objects.exclude(
+                recipeingredient__ingredient=self.ingredients[0]
+            ).first(),
+            ingredient=self.ingredients[0],
+            amount=1
+        )
+        deleted = Recipe.objects.order_by('pk').last()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        Recipe.objects.update_ingredients_count()
+        pantry.log_changes({
+            removed.recipe_id: [removed.ingredient_id],
+            added.recipe_id: [added.ingredient_id],
+            deleted_pk: None
+        })
+        for ingredient_ids in self.pantries:
+            self.assertMatchesDatabase(ingredient_ids)
+        self.assertIs(pantry._index, index)
+
+
+class PantryIndexUpdateTest(APITransactionTestCase):
+
+    def test_changes_reach_index(self):
+        reset_index()
+        author = CustomUser.objects.create(
+            email='chef@foodgram.ru',
+            username='chef',
+            first_name='Шеф',
+            last_name='Повар'
+        )
+        salt, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар')
+        )
+        self.assertEqual(list(rank_pantry([salt.pk])), [])
+        recipe = Recipe.objects.create(
+            author=author,
+            name='Суп',
+            text='Описание',
+            cooking_time=10,
+            ingredients_count=1
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=salt, amount=1
+        )
+        self.assertEqual(
+            list(rank_pantry([salt.pk])), [(recipe.pk, 1.0, 0)]
+        )
+        self.client.force_authenticate(author)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            {'ingredients': [
+                {'id': salt.pk, 'amount': 1}, {'id': sugar.pk, 'amount': 1}
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(rank_pantry([salt.pk])), [(recipe.pk, 0.5, 1)]
+        )
+        recipe.delete()
+        self.assertEqual(list(rank_pantry([salt.pk, sugar.pk])), [])
+
+
+class ReplicaRoutingTest(APITransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, 'replica_1'}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases['replica_1'] = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'TEST': {'MIRROR': DEFAULT_DB_ALIAS},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.databases['replica_1']
+
+    def setUp(self):
+        cache.clear()
+        db._unavailable.clear()
+        self.user = CustomUser.objects.create(
+            email='reader@foodgram.ru',
+            username='reader',
+            first_name='Читатель',
+            last_name='Реплики'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            name='Каша',
+            text='Описание',
+            cooking_time=10
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        db._unavailable.clear()
+
+    def replica_queries(self, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connections['replica_1']) as queries:
+            response = client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_reads_use_replica(self):
+        self.assertGreater(self.replica_queries(), 0)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.replica_queries(), 0)
+        cookieless = self.client_class()
+        cookieless.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.replica_queries(cookieless), 0)
+        cache.clear()
+        self.assertGreater(self.replica_queries(cookieless), 0)
+
+    def test_broken_replica_falls_back_to_primary(self):
+        error = OperationalError('Реплика недоступна.')
+        with mock.patch.object(
+            connections['replica_1'], 'cursor', side_effect=error
+        ), self.assertLogs('api.db', 'WARNING'):
+            response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Каша')
+        self.assertIn('replica_1', db._unavailable)
+        self.assertEqual(self.replica_queries(), 0)
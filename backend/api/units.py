@@ -0,0 +1,42 @@
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+GRAM = 'г'
+MILLILITRE = 'мл'
+PIECE = 'шт.'
+
+UNITS = {
+    'г': (GRAM, 1),
+    'кг': (GRAM, 1000),
+    'мл': (MILLILITRE, 1),
+    'л': (MILLILITRE, 1000),
+    'стакан': (MILLILITRE, 250),
+    'ст. л.': (MILLILITRE, 15),
+    'ч. л.': (MILLILITRE, 5),
+    'шт.': (PIECE, 1),
+}
+
+
+def base_unit(field):
+    bases = {}
+    for unit, (base, _) in UNITS.items():
+        bases.setdefault(base, []).append(unit)
+    return Case(
+        *[
+            When(**{f'{field}__in': units}, then=Value(base))
+            for base, units in bases.items()
+        ],
+        default=F(field),
+        output_field=CharField()
+    )
+
+
+def unit_factor(field):
+    return Case(
+        *[
+            When(**{field: unit}, then=Value(factor))
+            for unit, (_, factor) in UNITS.items()
+            if factor != 1
+        ],
+        default=Value(1),
+        output_field=IntegerField()
+    )
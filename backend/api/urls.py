@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import metrics_view
 from .views import (
     CustomUserViewSet,
     IngredientViewSet,
@@ -16,5 +17,6 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router.urls))
 ]
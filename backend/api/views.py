@@ -1,14 +1,33 @@
 from django.conf import settings
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from api.filters import IngredientFilter, IngredientSearchFilter, RecipeFilter
+from api.bulk import export_recipes, import_recipes
+from api.cache import CachedResponseMixin
+from api.feed import build_feed
+from api.filters import (
+    ORDERING_POPULAR,
+    POPULAR_ORDERING,
+    IngredientFilter,
+    IngredientSearchFilter,
+    RecipeFilter
+)
+from api.ingredient_search import search_ingredients
+from api.metrics import timer
+from api.pagination import KeysetPagination
+from api.pantry import ORDERING as PANTRY_ORDERING
+from api.pantry import rank_recipes
+from api.parsers import NDJSONParser
 from api.permissions import IsAuthor
+from api.recipe_search import ORDERING as SEARCH_ORDERING
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from api.serializers import (
     FavoriteSerializer,
     IngredientSerializer,
@@ -17,13 +36,14 @@ from api.serializers import (
     RecipeMinifiedSerializer,
     RecipeListSerializer,
     ShoppingCartSerializer,
+    ShoppingListItemSerializer,
     SubscriptionSerializer,
     UserSubscriptionsSerializer,
 )
+from api.shopping_cart import EXPORTERS, shopping_cart_items, shopping_list
 from recipes.models import (
     Favorite,
     Ingredient,
-    RecipeIngredient,
     Recipe,
     ShoppingCart,
     Subscription,
@@ -34,6 +54,8 @@ from users.models import CustomUser
 
 class CustomUserViewSet(UserViewSet):
     http_method_names = ['get', 'post', 'delete']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('username', 'pk')
 
     def get_permissions(self):
         if self.action in ('subscribe', 'subscriptions'):
@@ -61,15 +83,26 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         queryset = CustomUser.objects.filter(
             subscribed_by__user=self.request.user
-        ).all()
+        )
         context = self.get_serializer_context()
         page = self.paginate_queryset(queryset)
+        for author in page:
+            author.is_subscribed = True
+        prefetch_related_objects(page, Prefetch(
+            'recipes',
+            queryset=Recipe.objects.filter(
+                author__in=page
+            ).limit_per_author(context['recipes_limit']),
+            to_attr='recipes_preview'
+        ))
         serializer = self.get_serializer_class()(
             page,
             context=context,
             many=True
         )
-        return self.get_paginated_response(serializer.data)
+        with timer('serializer'):
+            data = serializer.data
+        return self.get_paginated_response(data)
 
     @action(methods=['post', 'delete'], detail=True)
     def subscribe(self, request, id=None):
@@ -97,24 +130,26 @@ class CustomUserViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    CachedResponseMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_class = IngredientFilter
     filter_backends = [IngredientSearchFilter]
 
-    def get_queryset(self):
-        name = self.request.query_params.get('name')
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
         if name:
-            return Ingredient.objects.filter(name__istartswith=name)
-        return Ingredient.objects.all()
+            return Response(search_ingredients(name))
+        return super().list(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -122,18 +157,62 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_class = RecipeFilter
 
     http_method_names = ['get', 'post', 'patch', 'delete']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-pub_date', '-pk')
+
+    def get_queryset(self):
+        return Recipe.objects.for_user(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(Recipe.objects.all())
+        if request.query_params.get('ordering') == ORDERING_POPULAR:
+            self.keyset_ordering = POPULAR_ORDERING
+        elif request.query_params.get('search', '').strip():
+            self.keyset_ordering = SEARCH_ORDERING
+        fields = dict.fromkeys(
+            ['pk'] + [field.lstrip('-') for field in self.keyset_ordering]
+        )
+        page = self.paginate_queryset(
+            queryset.values_list(*fields, named=True)
+        )
+        feed, counters = build_feed([row.pk for row in page], request)
+        response = self.get_paginated_response(feed)
+        response['X-Feed-Cache'] = ', '.join(
+            f'{name}={value}' for name, value in sorted(counters.items())
+        )
+        return response
 
     def get_permissions(self):
         if self.action in (
             'favorite',
             'shopping_cart',
-            'download_shopping_cart'
+            'download_shopping_cart',
+            'shopping_list',
+            'bulk',
+            'export'
         ):
             return [IsAuthenticated()]
         if self.action in ('patch', 'destroy'):
             return [IsAuthor()]
         return super().get_permissions()
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        feed, _ = build_feed([serializer.instance.pk], request)
+        return Response(feed[0], status=status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=kwargs.pop('partial', False)
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        feed, _ = build_feed([instance.pk], request)
+        return Response(feed[0])
+
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateUpdateSerializer
@@ -144,11 +223,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeListSerializer
 
     @staticmethod
-    def create_object(serializer, request, pk):
+    def create_object(serializer, request, pk, **data):
         recipe = get_object_or_404(Recipe, pk=pk)
         kwargs = {
             'user': request.user.id,
-            'recipe': recipe.id
+            'recipe': recipe.id,
+            **data
         }
         object_serializer = serializer(data=kwargs)
         object_serializer.is_valid(raise_exception=True)
@@ -177,33 +257,120 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(methods=['post'], detail=True)
     def shopping_cart(self, request, pk=None):
-        return self.create_object(self.get_serializer_class(), request, pk)
+        return self.create_object(
+            self.get_serializer_class(), request, pk,
+            servings=request.data.get('servings', 1)
+        )
+
+    @shopping_cart.mapping.patch
+    def update_shopping_cart(self, request, pk=None):
+        shopping_cart = get_object_or_404(
+            ShoppingCart,
+            recipe=pk,
+            user=request.user
+        )
+        serializer = ShoppingCartSerializer(
+            shopping_cart,
+            data={'servings': request.data.get('servings')},
+            partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            RecipeMinifiedSerializer(instance=shopping_cart.recipe).data
+        )
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk=None):
         return self.delete_object(ShoppingCart, request, pk)
 
-    @staticmethod
-    def save_file(items):
-        text = '\n'.join([
-            f"{item['ingredient__name']} "
-            f"({item['ingredient__measurement_unit']}) - {item['total']}"
-            for item in items
-        ])
-        filename = 'shopping_cart.txt'
-        response = HttpResponse(text, content_type='text/plain')
+    @action(
+        methods=['get'],
+        detail=False,
+        renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer]
+    )
+    def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        items = shopping_cart_items(request.user)
+        response = StreamingHttpResponse(
+            EXPORTERS[renderer.format](items),
+            content_type=renderer.media_type
+        )
+        filename = f'shopping_cart.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
     @action(methods=['get'], detail=False)
-    def download_shopping_cart(self, request):
-        items = RecipeIngredient.objects.select_related(
-            'recipe', 'ingredient'
-        ).filter(
-            recipe__shoppingcarts__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total=Sum('amount')
-        ).order_by('ingredient__name')
-        return self.save_file(items)
+    def shopping_list(self, request):
+        return Response(ShoppingListItemSerializer(
+            shopping_list(request.user), many=True
+        ).data)
+
+    @action(
+        methods=['post'],
+        detail=False,
+        parser_classes=[JSONParser, NDJSONParser]
+    )
+    def bulk(self, request):
+        records = request.data
+        if not isinstance(records, list):
+            return Response(
+                {'errors': ['Ожидается список рецептов.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(records) > settings.RECIPE_IMPORT_MAX_ITEMS:
+            return Response(
+                {'errors': [
+                    'Не более '
+                    f'{settings.RECIPE_IMPORT_MAX_ITEMS} рецептов за запрос.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        results = list(import_recipes(records, request.user))
+        return Response({
+            'created': sum('id' in result for result in results),
+            'failed': sum('errors' in result for result in results),
+            'results': results
+        })
+
+    @action(methods=['get'], detail=False)
+    def export(self, request):
+        return StreamingHttpResponse(
+            export_recipes(request),
+            content_type=NDJSONParser.media_type
+        )
+
+    @staticmethod
+    def get_pantry(request):
+        values = ','.join(request.query_params.getlist('ingredients'))
+        try:
+            ingredient_ids = {
+                int(value) for value in values.split(',') if value.strip()
+            }
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': ['Ожидается список id ингредиентов.']}
+            )
+        if not ingredient_ids:
+            raise ValidationError(
+                {'ingredients': ['Укажите хотя бы один ингредиент.']}
+            )
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise ValidationError({'ingredients': [
+                f'Не более {settings.PANTRY_MAX_INGREDIENTS} ингредиентов.'
+            ]})
+        return ingredient_ids
+
+    @action(methods=['get'], detail=False)
+    def pantry(self, request):
+        self.keyset_ordering = PANTRY_ORDERING
+        page = self.paginate_queryset(rank_recipes(
+            self.filter_queryset(Recipe.objects.all()),
+            self.get_pantry(request)
+        ))
+        rows = {row.pk: row for row in page}
+        feed, _ = build_feed(list(rows), request)
+        for recipe in feed:
+            recipe['coverage'] = rows[recipe['id']].coverage
+            recipe['missing'] = rows[recipe['id']].missing
+        return self.get_paginated_response(feed)
@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.db.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,10 +82,46 @@ else:
             'USER': os.getenv('POSTGRES_USER', default='postgres'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
             'HOST': os.getenv('DB_HOST', default='db'),
-            'PORT': os.getenv('DB_PORT', default=5432)
+            'PORT': os.getenv('DB_PORT', default=5432),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', default=False) == 'True',
         }
     }
 
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', default=True) != 'False'
+
+DB_REPLICAS = [replica for replica in os.getenv('DB_REPLICAS', default='').split(',') if replica]
+
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if DB_SQLITE:
+        location = {'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        location = {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        **location,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+REPLICA_PIN_TIMEOUT = int(os.getenv('DB_REPLICA_PIN_TIMEOUT', default=5))
+REPLICA_RETRY_TIMEOUT = 30
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+FEED_CACHE_TIMEOUT = 60 * 60
+
+RECIPE_BULK_BATCH_SIZE = 100
+RECIPE_IMPORT_MAX_ITEMS = 1000
+RECIPE_EXPORT_CHUNK_SIZE = 500
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -116,7 +154,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -147,6 +185,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_PIPELINE_BACKEND = os.getenv('IMAGE_PIPELINE_BACKEND', default='api.images.ThreadPoolBackend')
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', default=2))
+RECIPE_THUMBNAIL_SIZES = (320, 640)
+RECIPE_THUMBNAIL_FORMATS = ('webp', 'jpeg')
+RECIPE_THUMBNAIL_QUALITY = 80
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -165,3 +209,55 @@ USERNAME_PATTERN = r"^[\w.@+-]+\Z"
 SLUG_PATTERN = "^[-a-zA-Z0-9_]+"
 
 DEFAULT_RECIPES_LIMIT = 3
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_CART_MAX_SERVINGS = 50
+SHOPPING_CART_CHUNK_SIZE = 100
+SHOPPING_CART_PDF_CHUNK = 64 * 1024
+SHOPPING_CART_PDF_FONT = os.getenv('SHOPPING_CART_PDF_FONT', default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', default='memory')
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_TIMEOUT = 60 * 5
+
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_CHUNK_SIZE = 500
+
+PANTRY_MAX_INGREDIENTS = 100
+PANTRY_SEARCH_BACKEND = os.getenv('PANTRY_SEARCH_BACKEND', default='memory')
+PANTRY_INDEX_FILE = os.getenv('PANTRY_INDEX_FILE', default='')
+PANTRY_INDEX_DENSITY = 256
+PANTRY_INDEX_CHUNK_SIZE = 10000
+PANTRY_INDEX_MAX_CHANGES = 1000
+PANTRY_INDEX_SAVE_CHANGES = 100
+PANTRY_CHANGES_TIMEOUT = 60 * 60 * 24
+PANTRY_CHANGES_WAIT = 10
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', default=0.1))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+QUERY_BUDGET_ACTION = os.getenv('QUERY_BUDGET_ACTION', default='log')
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 12,
+    'RecipeViewSet.retrieve': 8,
+    'RecipeViewSet.pantry': 12,
+    'RecipeViewSet.download_shopping_cart': 3,
+    'RecipeViewSet.shopping_list': 3,
+    'CustomUserViewSet.subscriptions': 6,
+    'TagViewSet.list': 2,
+    'IngredientViewSet.list': 2,
+}
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+TOKEN_LOCAL_CACHE_TIMEOUT = int(os.getenv('TOKEN_LOCAL_CACHE_TIMEOUT', default=5))
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS', default='')
+
+TASK_QUEUE_BACKEND = os.getenv('TASK_QUEUE_BACKEND', default='api.tasks.SyncBackend')
+TASK_QUEUE_REDIS_URL = os.getenv('TASK_QUEUE_REDIS_URL', default='redis://redis:6379/0')
+TASK_WORKER_PROCESSES = int(os.getenv('TASK_WORKER_PROCESSES', default=2))
+TASK_POLL_INTERVAL = 1
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 5
+TASK_RETRY_MAX_DELAY = 60 * 10
+TASK_TIMEOUT = 60 * 10
+TASK_RESULT_TIMEOUT = 60 * 60 * 24
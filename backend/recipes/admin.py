@@ -46,15 +46,22 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
     def count_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'Кол-во добавлений в избранное'
+    count_favorites.admin_order_field = 'favorites_count'
 
     def ingredients_list(self, obj):
         return [str(ingredient) for ingredient in obj.ingredients.all()]
 
     ingredients_list.short_description = 'Ингредиенты'
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(
+            pk=form.instance.pk
+        ).update_ingredients_count()
+
 
 admin.site.register(Recipe, RecipeAdmin)
 
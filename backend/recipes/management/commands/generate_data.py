@@ -0,0 +1,221 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag
+)
+from users.models import CustomUser
+
+WORDS = (
+    'Домашний', 'Быстрый', 'Летний', 'Пряный', 'Сливочный', 'Запечённый',
+    'Острый', 'Овощной', 'Праздничный', 'Лёгкий', 'Бабушкин', 'Сытный',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'омлет', 'рагу', 'плов', 'гарнир', 'соус',
+    'десерт', 'завтрак', 'бульон', 'запеканка',
+)
+
+
+class Zipf:
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+        self.rng = rng
+
+    def sample(self, count):
+        count = min(count, len(self.items))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rng.choices(
+                self.items, cum_weights=self.weights, k=count - len(chosen)
+            ))
+        return list(chosen)
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.weights)[0]
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            type=int,
+            default=8,
+            help='Среднее количество ингредиентов в рецепте.'
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=20,
+            help='Среднее количество избранных рецептов у пользователя.'
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=5,
+            help='Среднее количество рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=10,
+            help='Среднее количество подписок у пользователя.'
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--prefix',
+            default='bench',
+            help='Префикс имён и почты создаваемых пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        if not ingredients or not tags:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги командой load.'
+            )
+        if CustomUser.objects.filter(
+            username__startswith=f"{options['prefix']}_"
+        ).exists():
+            raise CommandError(
+                f"Пользователи с префиксом {options['prefix']} уже есть."
+            )
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        exponent = options['zipf']
+
+        start = time.monotonic()
+        with transaction.atomic():
+            users = self.create_users(options['users'], options['prefix'])
+            recipes = self.create_recipes(
+                options['recipes'],
+                Zipf(users, exponent, self.rng),
+                Zipf(ingredients, exponent, self.rng),
+                tags,
+                options['ingredients_per_recipe']
+            )
+            popular = Zipf(recipes, exponent, self.rng)
+            self.create_links(Favorite, users, popular, options['favorites'])
+            self.create_links(ShoppingCart, users, popular, options['carts'])
+            self.create_subscriptions(
+                users, Zipf(users, exponent, self.rng),
+                options['subscriptions']
+            )
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_pantry_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'время: {time.monotonic() - start:.2f} с'
+        ))
+
+    def bulk_create(self, model, objects):
+        created = 0
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size]
+            )
+            created += len(objects[start:start + self.batch_size])
+        return created
+
+    def create_objects(self, model, objects):
+        last_pk = model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        self.bulk_create(model, objects)
+        return list(
+            model.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)
+        )
+
+    def count(self, mean):
+        return max(1, round(self.rng.expovariate(1 / mean))) if mean else 0
+
+    def create_users(self, count, prefix):
+        password = make_password(prefix)
+        return self.create_objects(CustomUser, [
+            CustomUser(
+                email=f'{prefix}_{number}@example.com',
+                username=f'{prefix}_{number}',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+                password=password
+            )
+            for number in range(count)
+        ])
+
+    def create_recipes(self, count, authors, ingredients, tags, mean):
+        recipe_ingredients = [
+            ingredients.sample(self.count(mean)) for _ in range(count)
+        ]
+        recipes = self.create_objects(Recipe, [
+            Recipe(
+                author_id=authors.choice(),
+                name=(
+                    f'{self.rng.choice(WORDS)} {self.rng.choice(DISHES)} '
+                    f'№{number}'
+                ),
+                text=' '.join(self.rng.choices(WORDS + DISHES, k=40)),
+                cooking_time=self.rng.randint(5, 180),
+                ingredients_count=len(items)
+            )
+            for number, items in enumerate(recipe_ingredients)
+        ])
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in self.rng.sample(tags, self.rng.randint(1, len(tags)))
+        ])
+        self.bulk_create(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe, items in zip(recipes, recipe_ingredients)
+            for ingredient in items
+        ])
+        return recipes
+
+    def create_links(self, model, users, recipes, mean):
+        self.bulk_create(model, [
+            model(user_id=user, recipe_id=recipe)
+            for user in users
+            for recipe in recipes.sample(self.count(mean))
+        ])
+
+    def create_subscriptions(self, users, authors, mean):
+        self.bulk_create(Subscription, [
+            Subscription(user_id=user, author_id=author)
+            for user in users
+            for author in authors.sample(self.count(mean))
+            if author != user
+        ])
@@ -1,7 +1,11 @@
-import os
 import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from recipes.models import Ingredient, Tag
 
 Tags_data = (
@@ -10,22 +14,178 @@ Tags_data = (
     {'name': 'Ужин', 'color': '#8775D2', 'slug': 'dinner'},
 )
 
+FORMATS = ('csv', 'json')
+KEYS = ('name', 'measurement_unit')
+READ_SIZE = 64 * 1024
+
+
+def read_csv(f):
+    for row in csv.reader(f):
+        if row:
+            yield dict(zip(KEYS, row))
+
+
+def read_json(f):
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON-файл должен содержать массив объектов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON-файл.')
+            buffer += chunk
+            continue
+        yield {key: item[key] for key in KEYS}
+        buffer = buffer[end:]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def batches(items, size):
+    items = iter(items)
+    batch = list(islice(items, size))
+    while batch:
+        yield batch
+        batch = list(islice(items, size))
+
+
+class RowsFile:
+    def __init__(self, rows):
+        self.lines = (self.to_csv(row) for row in rows)
+        self.buffer = ''
+
+    @staticmethod
+    def to_csv(row):
+        values = (row[key].replace('"', '""') for key in KEYS)
+        return ','.join(f'"{value}"' for value in values) + '\n'
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
 
 class Command(BaseCommand):
+    help = 'Загрузка ингредиентов и тегов в базу данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join('data', 'ingredients.csv'),
+            help='Путь к файлу с ингредиентами.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла, по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном INSERT.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Проверить загрузку и откатить изменения.'
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загрузить через COPY во временную таблицу (PostgreSQL).'
+        )
 
     def handle(self, *args, **options):
-        path = os.path.join('data', 'ingredients.csv')
-        print('File path: ', path)
-
-        with open(path) as f:
-            reader = csv.reader(f)
-            keys = ['name', 'measurement_unit']
-            for row in reader:
-                _, created = Ingredient.objects.get_or_create(
-                    **dict(zip(keys, row))
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.')
+        )
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('Загрузка через COPY доступна для PostgreSQL.')
+        self.stdout.write(f'File path: {path}')
+
+        start = time.monotonic()
+        with open(path, encoding='utf-8') as f, transaction.atomic():
+            rows = READERS[file_format](f)
+            if options['copy']:
+                total, inserted = self.copy_ingredients(rows)
+            else:
+                total, inserted = self.insert_ingredients(
+                    rows, options['batch_size']
                 )
+            Tag.objects.bulk_create(
+                [Tag(**tag_data) for tag_data in Tags_data],
+                ignore_conflicts=True
+            )
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        elapsed = time.monotonic() - start
+
+        self.stdout.write(
+            f'Ингредиентов в файле: {total}, '
+            f'добавлено: {inserted}, пропущено: {total - inserted}, '
+            f'время: {elapsed:.2f} с'
+        )
+        if options['dry_run']:
+            self.stdout.write('Пробный запуск, изменения отменены.')
+        else:
+            self.stdout.write(
+                self.style.SUCCESS('Загрузка данных Ingredient и Tag готова!')
+            )
 
-        for tag_data in Tags_data:
-            _, created = Tag.objects.get_or_create(**tag_data)
+    @staticmethod
+    def insert_ingredients(rows, batch_size):
+        before = Ingredient.objects.count()
+        total = 0
+        for batch in batches(rows, batch_size):
+            total += len(batch)
+            Ingredient.objects.bulk_create(
+                [Ingredient(**row) for row in batch],
+                ignore_conflicts=True
+            )
+        return total, Ingredient.objects.count() - before
 
-        return print('Загрузка данных Ingredient и Tag готова!')
+    @staticmethod
+    def copy_ingredients(rows):
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_staging '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH CSV',
+                RowsFile(rows)
+            )
+            cursor.execute('SELECT COUNT(*) FROM ingredient_staging')
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_staging '
+                'ON CONFLICT DO NOTHING'
+            )
+            inserted = cursor.rowcount
+        return total, inserted
@@ -1,9 +1,25 @@
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.core.validators import MinValueValidator
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models.expressions import Window
+from django.db.models.functions import (
+    Cast,
+    Coalesce,
+    Greatest,
+    RowNumber
+)
 from users.models import CustomUser
 
+DENORMALIZED_FIELDS = (
+    'thumbnails_ready',
+    'favorites_count',
+    'in_carts_count',
+    'ingredients_count',
+    'search_vector'
+)
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -56,6 +72,114 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def limit_per_author(self, limit):
+        windowed = self.order_by().annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=models.F('pub_date').desc()
+            )
+        ).values('id', 'row_number')
+        try:
+            sql, params = windowed.query.sql_with_params()
+        except EmptyResultSet:
+            return self.none()
+        return self.extra(
+            where=[
+                f'{self.model._meta.db_table}.id IN ('
+                f'SELECT id FROM ({sql}) AS windowed '
+                f'WHERE row_number <= %s)'
+            ],
+            params=params + (limit,)
+        )
+
+    def for_user(self, user):
+        if user.is_authenticated:
+            is_subscribed = models.Exists(
+                Subscription.objects.filter(
+                    user=user, author=models.OuterRef('pk')
+                )
+            )
+        else:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField()
+            )
+        return self.prefetch_related(
+            'tags',
+            models.Prefetch(
+                'author',
+                queryset=CustomUser.objects.annotate(
+                    is_subscribed=is_subscribed
+                )
+            ),
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        ).with_user_flags(user)
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                )
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            )
+        )
+
+    def by_pantry(self, ingredient_ids):
+        matched = models.Count(
+            'recipeingredient', distinct=self.query.distinct
+        )
+        total = Greatest('ingredients_count', 'matched')
+        return self.filter(
+            recipeingredient__ingredient_id__in=ingredient_ids
+        ).annotate(
+            matched=matched
+        ).annotate(
+            coverage=models.ExpressionWrapper(
+                Cast('matched', models.FloatField()) / total,
+                output_field=models.FloatField()
+            ),
+            missing=models.ExpressionWrapper(
+                total - models.F('matched'),
+                output_field=models.IntegerField()
+            )
+        )
+
+    def update_ingredients_count(self):
+        return self.update(
+            ingredients_count=Coalesce(
+                models.Subquery(
+                    RecipeIngredient.objects.filter(
+                        recipe=models.OuterRef('pk')
+                    ).order_by().values('recipe').annotate(
+                        count=models.Count('pk')
+                    ).values('count')
+                ),
+                0
+            )
+        )
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -82,6 +206,11 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Картинка'
     )
+    thumbnails_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Миниатюры готовы'
+    )
     text = models.TextField(
         verbose_name='Описание'
     )
@@ -94,15 +223,59 @@ class Recipe(models.Model):
         db_index=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в список покупок'
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество ингредиентов'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_popular_idx'
+            )
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if update_fields is None and not force_insert and (
+            not self._state.adding
+        ):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in DENORMALIZED_FIELDS
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
 
 def validate_recipe(value):
     if len(value) < 1:
@@ -130,6 +303,18 @@ class RecipeIngredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_recipe_idx'
+            )
+        ]
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
 
@@ -199,6 +384,15 @@ class Favorite(Common):
 
 
 class ShoppingCart(Common):
+    servings = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[
+            MinValueValidator(1),
+            MaxValueValidator(settings.SHOPPING_CART_MAX_SERVINGS)
+        ],
+        verbose_name='Количество порций'
+    )
+
     class Meta(Common.Meta):
         default_related_name = 'shoppingcarts'
         constraints = [
@@ -209,3 +403,32 @@ class ShoppingCart(Common):
         ]
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.BigIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_user_ingredient'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount} у {self.user}'
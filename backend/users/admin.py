@@ -13,11 +13,13 @@ class CustomUserAdmin(admin.ModelAdmin):
     list_filter = ('email', 'first_name',)
 
     def count_recipes(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     count_recipes.short_description = 'Кол-во рецептов'
+    count_recipes.admin_order_field = 'recipes_count'
 
     def count_subscribers(self, obj):
-        return obj.subscribed_by.count()
+        return obj.subscribers_count
 
     count_subscribers.short_description = 'Кол-во подписчиков'
+    count_subscribers.admin_order_field = 'subscribers_count'